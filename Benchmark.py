@@ -0,0 +1,220 @@
+import math
+import random
+import statistics
+import sys
+import time
+
+from Genetic import PENALTY
+from HashTable import HashTable
+from HeldKarp import held_karp
+from Helper import genetic_algorithm, hours_to_string
+from Package import Package
+from Report import write_rows
+from Truck import Truck
+
+"""Harness to compare the solvers on generated instances where the best route is known, so a setting can be picked
+from data and not from one lucky seed. Every solver runs for several seeds and time budgets, and the results have the
+gap to the best route, the best score over time and the routes scored per second. Run it with python Benchmark.py."""
+
+# Side of the square the stops are placed in, in miles
+AREA = 10
+
+# Columns of the summary table, in order
+SUMMARY_COLUMNS = ["instance", "solver", "time_limit", "runs", "mean_gap", "worst_gap", "optimal", "routes_per_second"]
+
+
+class Instance:
+    """A generated route for one truck with the best distance known, as a distance matrix where 0 is the hub"""
+
+    def __init__(self, name: str, points: list, optimum: float = None, deadlines: dict = None) -> None:
+        """
+        :param name: name in the results
+        :param points: (x, y) of the hub and then of every stop, the distances are straight lines
+        :param optimum: distance of the best route, found with held_karp if None
+        :param deadlines: stop index -> deadline as "hh:mm:ss", a package is made for every stop with a deadline
+        """
+        self.name = name
+        self.adjacency_mat = [[math.dist(a, b) for b in points] for a in points]
+        self.stops = list(range(1, len(points)))
+        self.address_index = {f"Stop {stop}": stop for stop in self.stops}
+        self.hash_map = HashTable()
+        self.truck = Truck(1, 18, "Hub", "08:00:00")
+        for stop, deadline in (deadlines or {}).items():
+            self.hash_map.insert(stop, Package(stop, f"Stop {stop}", "Salt Lake City", "UT", "84111", deadline, "1",
+                                               "None"))
+            self.truck.packages.append(stop)
+        if optimum is None:
+            _, optimum = held_karp(self.stops, self.adjacency_mat, self.address_index, self.hash_map, self.truck)
+        self.optimum = optimum
+
+
+def circle_instance(num_stops: int, seed: int = 0) -> Instance:
+    """Hub and stops at random places on a circle. Points on a circle are all corners of their convex hull, so the
+    best route goes around the circle and its distance is the perimeter of the polygon.
+    Big(O): O(n^2) for the distance matrix"""
+    rng = random.Random(seed)
+    angles = sorted([0.0] + [rng.uniform(0, 2 * math.pi) for _ in range(num_stops)])
+    radius = AREA / 2
+    points = [(radius * math.cos(angle), radius * math.sin(angle)) for angle in angles]
+    optimum = sum(math.dist(points[i - 1], points[i]) for i in range(len(points)))
+    return Instance(f"circle-{num_stops}", points, optimum)
+
+
+def random_instance(num_stops: int, seed: int = 0) -> Instance:
+    """Hub in the middle and stops at random places, small enough for held_karp to find the best route
+    Big(O): O(2^n * n^2) for held_karp"""
+    rng = random.Random(seed)
+    points = [(AREA / 2, AREA / 2)] + [(rng.uniform(0, AREA), rng.uniform(0, AREA)) for _ in range(num_stops)]
+    return Instance(f"random-{num_stops}", points)
+
+
+def deadline_instance(num_stops: int, seed: int = 0, fraction: float = 0.3) -> Instance:
+    """Like random_instance, with deadlines on a fraction of the stops. The deadlines are the times a random route
+    reaches the stops plus a minute, so there is always a route that makes them all, and held_karp finds the best one.
+    Big(O): O(2^n * n^2) for held_karp"""
+    rng = random.Random(seed)
+    points = [(AREA / 2, AREA / 2)] + [(rng.uniform(0, AREA), rng.uniform(0, AREA)) for _ in range(num_stops)]
+    order = rng.sample(range(1, len(points)), num_stops)
+    deadlines = {}
+    miles = 0
+    previous = 0
+    for stop in order:
+        miles += math.dist(points[previous], points[stop])
+        previous = stop
+        if rng.random() < fraction:
+            deadlines[stop] = hours_to_string(8 + miles / 18 + 1 / 60)
+    return Instance(f"deadline-{num_stops}", points, deadlines=deadlines)
+
+
+def default_instances() -> list:
+    return [
+        circle_instance(20),
+        circle_instance(50),
+        random_instance(12),
+        deadline_instance(12),
+    ]
+
+
+def _genetic(**options):
+    """Solver that runs genetic_algorithm with the options until the time limit"""
+    def solve(instance: Instance, time_limit: float, history: list, rng: random.Random):
+        return genetic_algorithm(
+            instance.stops, instance.adjacency_mat, instance.address_index, instance.hash_map, instance.truck,
+            num_iter=sys.maxsize, exact_threshold=0, time_limit=time_limit, history=history, rng=rng, **options
+        )
+    # Every generation scores the whole population, for the routes per second
+    solve.num_population = options.get("num_population", 25)
+    return solve
+
+
+# Solver modes to compare, by name
+SOLVERS = {
+    "tournament": _genetic(),
+    "roulette": _genetic(selection="roulette"),
+    "adaptive": _genetic(adaptive=True),
+    "no-repair": _genetic(repair=False),
+    "population-100": _genetic(num_population=100),
+}
+
+
+def run_benchmark(instances: list, solvers: dict = None, seeds=range(5), time_limits=(0.1, 0.5, 2.0)) -> list:
+    """
+    Run every solver on every instance for every seed and time limit.
+    :param instances: list of Instance
+    :param solvers: name -> function(instance, time_limit, history, rng) that returns the route and its score, SOLVERS by
+    default
+    :param seeds: seeds for the random.Random of each run, one run for each
+    :param time_limits: seconds that each run is given
+    :return: list of dictionaries, one for each run, with the instance, solver, seed, time_limit, score, gap to the
+    optimum as a fraction, seconds, generations, routes_per_second and curve, the (seconds, score) of every new best
+    Big(O): O(instances * solvers * seeds * sum(time_limits)) seconds
+    """
+    if solvers is None:
+        solvers = SOLVERS
+    results = []
+    for instance in instances:
+        for name, solve in solvers.items():
+            for time_limit in time_limits:
+                for seed in seeds:
+                    history = []
+                    start = time.perf_counter()
+                    route, score = solve(instance, time_limit, history, random.Random(seed))
+                    seconds = time.perf_counter() - start
+                    generations = history[-1][1] if history else 0
+                    results.append({
+                        "instance": instance.name,
+                        "solver": name,
+                        "seed": seed,
+                        "time_limit": time_limit,
+                        "score": score,
+                        "gap": score / instance.optimum - 1,
+                        "seconds": seconds,
+                        "generations": generations,
+                        "routes_per_second": generations * getattr(solve, "num_population", 0) / seconds,
+                        "curve": [(at, best) for at, _, best in history[:-1]],
+                    })
+    return results
+
+
+def summarize(results: list) -> list:
+    """One row for every instance, solver and time limit, with the mean and worst gap over the seeds, the number of
+    runs that found the best route and the mean routes per second
+    Big(O): O(n) for n results"""
+    groups = {}
+    for result in results:
+        groups.setdefault((result["instance"], result["solver"], result["time_limit"]), []).append(result)
+    rows = []
+    for (instance, solver, time_limit), runs in groups.items():
+        gaps = [run["gap"] for run in runs]
+        rows.append({
+            "instance": instance,
+            "solver": solver,
+            "time_limit": time_limit,
+            "runs": len(runs),
+            "mean_gap": statistics.mean(gaps),
+            "worst_gap": max(gaps),
+            "optimal": sum(gap < 1e-9 for gap in gaps),
+            "routes_per_second": statistics.mean(run["routes_per_second"] for run in runs),
+        })
+    return rows
+
+
+def write_summary(results: list, out=None, fmt: str = "text") -> int:
+    """Write the summary table as text, CSV or JSON, see Report.write_rows
+    :return: number of rows written"""
+    return write_rows(
+        summarize(results),
+        out,
+        fmt,
+        "{instance:<12} {solver:<15} {time_limit:>5}s  gap {mean_gap:7.2%} mean, {worst_gap:7.2%} worst  "
+        "{optimal}/{runs} optimal  {routes_per_second:9,.0f} routes/s",
+        SUMMARY_COLUMNS,
+    )
+
+
+# pytest
+def test_benchmark():
+    import io
+
+    instance = circle_instance(9)
+    # held_karp agrees with the perimeter of the circle
+    _, exact = held_karp(instance.stops, instance.adjacency_mat, {}, HashTable(), Truck(1, 18, "Hub"))
+    assert math.isclose(exact, instance.optimum)
+
+    deadlines = deadline_instance(8, seed=3)
+    assert deadlines.truck.packages and deadlines.optimum < PENALTY
+
+    results = run_benchmark([instance, deadlines], {"tournament": SOLVERS["tournament"]}, seeds=[0, 1],
+                            time_limits=[0.05])
+    assert len(results) == 4
+    for result in results:
+        assert result["gap"] >= -1e-9
+        assert result["generations"] > 0 and result["routes_per_second"] > 0
+        assert [best for _, best in result["curve"]] == sorted((best for _, best in result["curve"]), reverse=True)
+
+    out = io.StringIO()
+    assert write_summary(results, out, "csv") == 2
+
+
+if __name__ == "__main__":
+    write_summary(run_benchmark(default_instances()))
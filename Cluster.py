@@ -0,0 +1,234 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from Genetic import route_cost, spawn_rngs, stop_deadline_miles
+from HashTable import HashTable
+from Helper import genetic_algorithm
+from Truck import Truck
+
+"""Decomposition solver for routes with too many stops for one genetic algorithm. The stops are split into
+geographic clusters with k-medoids on the distance matrix, every cluster is solved in a worker process with the per
+truck genetic_algorithm, and the cluster tours are stitched into one route that is polished with 2-opt."""
+
+# Stops in a cluster, small enough for genetic_algorithm to solve well in a few seconds
+CLUSTER_SIZE = 60
+
+# Most positions apart that polish tries to reverse, so one pass stays linear in the number of stops
+POLISH_WINDOW = 50
+
+# Data of the worker processes, set once by _init_worker instead of sending the distance matrix with every cluster
+_worker = {}
+
+
+def k_medoids(stops, adjacency_mat, k: int, max_iter: int = 100) -> list:
+    """
+    Split the stops into k clusters. Every cluster has a medoid, the stop with the smallest total distance to the
+    other stops of the cluster, and every stop belongs to the cluster of its closest medoid. The first medoids are
+    picked farthest first, starting with the stop farthest from the hub, so the result does not depend on random.
+    :param stops: list of the location indexes
+    :param adjacency_mat: matrix with the distances between the locations
+    :param k: number of clusters
+    :param max_iter: most rounds of assigning the stops and moving the medoids
+    :return: list of the clusters, each a list of location indexes
+    Big(O): O(max_iter * (n * k + n^2 / k)) for n stops
+    """
+    stops = list(stops)
+    k = max(1, min(k, len(stops)))
+    medoids = [max(stops, key=lambda stop: adjacency_mat[0][stop])]
+    closest = {stop: adjacency_mat[medoids[0]][stop] for stop in stops}
+    while len(medoids) < k:
+        medoid = max(stops, key=closest.get)
+        medoids.append(medoid)
+        for stop in stops:
+            closest[stop] = min(closest[stop], adjacency_mat[medoid][stop])
+
+    clusters = []
+    for _ in range(max_iter):
+        clusters = [[] for _ in medoids]
+        for stop in stops:
+            nearest = min(range(len(medoids)), key=lambda i: adjacency_mat[medoids[i]][stop])
+            clusters[nearest].append(stop)
+        new_medoids = [
+            min(cluster, key=lambda medoid: sum(adjacency_mat[medoid][stop] for stop in cluster))
+            for cluster in clusters
+        ]
+        if new_medoids == medoids:
+            break
+        medoids = new_medoids
+    return [cluster for cluster in clusters if cluster]
+
+
+def stitch(tours: list, adjacency_mat, deadline_miles: dict = None) -> list:
+    """
+    Join the cluster tours into one route. Each tour is a cycle, so it can be entered at any stop and driven either
+    way, leaving out the edge between the entry stop and the exit stop. From the hub, the next tour and its entry
+    stop and direction are the ones that add the fewest miles to the route. Tours with an earlier deadline go first.
+    :param tours: list of the cluster tours as lists of location indexes
+    :param adjacency_mat: matrix with the distances between the locations
+    :param deadline_miles: dictionary from stop_deadline_miles, or None
+    :return: the route as a list of location indexes, without the hub
+    Big(O): O(t * n) for t tours and n stops
+    """
+    deadline_miles = deadline_miles or {}
+    remaining = [list(tour) for tour in tours if tour]
+    route = []
+    current = 0
+    while remaining:
+        best = None
+        for number, tour in enumerate(remaining):
+            urgency = min((deadline_miles.get(stop, float("inf")) for stop in tour))
+            size = len(tour)
+            for i, stop in enumerate(tour):
+                # Forward leaves out the edge before the entry stop, backward the edge after it
+                forward = adjacency_mat[current][stop] - adjacency_mat[tour[i - 1]][stop]
+                backward = adjacency_mat[current][stop] - adjacency_mat[stop][tour[(i + 1) % size]]
+                for added, direction in ((forward, 1), (backward, -1)):
+                    if best is None or (urgency, added) < best[0]:
+                        best = ((urgency, added), number, i, direction)
+        _, number, i, direction = best
+        tour = remaining.pop(number)
+        if direction == 1:
+            tour = tour[i:] + tour[:i]
+        else:
+            tour = tour[i::-1] + tour[:i:-1]
+        route.extend(tour)
+        current = tour[-1]
+    return route
+
+
+def polish(route: list, adjacency_mat, deadline_miles: dict = None, window: int = POLISH_WINDOW) -> list:
+    """
+    Improve the route with 2-opt, reversing the stops between positions i and j when that makes the route shorter,
+    for j at most window positions after i. The change in miles only looks at the two edges that are swapped, which
+    assumes the distance matrix is symmetric. With deadlines, a reversal is only kept when the route is not late more
+    often than before.
+    :param route: list of location indexes without the hub
+    :param adjacency_mat: matrix with the distances between the locations
+    :param deadline_miles: dictionary from stop_deadline_miles, or None
+    :param window: most positions apart that are reversed
+    :return: the improved route as a new list
+    Big(O): O(n * window) per pass, plus O(n) to check the deadlines of every reversal that is kept
+    """
+    deadline_miles = deadline_miles or {}
+    path = [0] + list(route) + [0]
+    cost = route_cost(path[1:-1], adjacency_mat, deadline_miles, 0)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 2):
+            for j in range(i + 1, min(i + window, len(path) - 1)):
+                before, first, last, after = path[i - 1], path[i], path[j], path[j + 1]
+                change = (adjacency_mat[before][last] + adjacency_mat[first][after]
+                          - adjacency_mat[before][first] - adjacency_mat[last][after])
+                if change >= -1e-9:
+                    continue
+                candidate = path[:i] + path[i:j + 1][::-1] + path[j + 1:]
+                new_cost = route_cost(candidate[1:-1], adjacency_mat, deadline_miles, 0) if deadline_miles \
+                    else cost + change
+                if new_cost < cost:
+                    path = candidate
+                    cost = new_cost
+                    improved = True
+    return path[1:-1]
+
+
+def _init_worker(adjacency_mat, address_index, hash_map, truck, options) -> None:
+    """Keep the data that every cluster needs in the worker process"""
+    _worker.update(
+        adjacency_mat=adjacency_mat, address_index=address_index, hash_map=hash_map, truck=truck, options=options
+    )
+
+
+def _solve_cluster(cluster: list, rng: random.Random) -> list:
+    """Solve one cluster with genetic_algorithm, with its own stream so the result does not depend on the worker"""
+    route, _ = genetic_algorithm(
+        cluster, _worker["adjacency_mat"], _worker["address_index"], _worker["hash_map"], _worker["truck"],
+        rng=rng, **_worker["options"]
+    )
+    return route
+
+
+def cluster_genetic_algorithm(
+        location_indexes,
+        adjacency_mat,
+        address_index,
+        hash_map: HashTable,
+        truck: Truck,
+        cluster_size: int = CLUSTER_SIZE,
+        workers: int = None,
+        verbose: bool = False,
+        rng=None,
+        **options,
+):
+    """
+    Find a route for a truck with many stops by solving clusters of the stops on their own. Routes with up to
+    cluster_size stops are solved with genetic_algorithm directly.
+    :param location_indexes: list of the location indexes (values in the address_dict)
+    :param adjacency_mat: matrix with the distances between the locations
+    :param address_index: dictionary with keys as the address string and the value as the index in the adjacency matrix
+    :param hash_map: hash table of the packages with key as the package id
+    :param truck: truck object
+    :param cluster_size: number of stops to aim for in each cluster
+    :param workers: number of worker processes, None for one for each CPU and 1 to solve in this process
+    :param verbose: print the progress
+    :param rng: random.Random that the stream of every cluster is spawned from, the random module if None
+    :param options: passed on to genetic_algorithm for every cluster, for example num_iter
+    :return: the route as a list of location indexes and its cost as in genetic_algorithm
+    Big(O): O(n^2 / k) for the clusters, the genetic algorithm of k clusters spread over the workers, O(n * k) to
+    stitch them and O(n * POLISH_WINDOW) for each polish pass
+    """
+    stops = list(location_indexes)
+    if len(stops) <= cluster_size:
+        return genetic_algorithm(
+            stops, adjacency_mat, address_index, hash_map, truck, verbose=verbose, rng=rng, **options
+        )
+
+    clusters = k_medoids(stops, adjacency_mat, -(-len(stops) // cluster_size))
+    if verbose:
+        print(f"Solving {len(clusters)} clusters of {len(stops)} stops")
+    # The streams are spawned here so the route only depends on rng, not on which worker solves which cluster
+    rngs = spawn_rngs(random if rng is None else rng, len(clusters))
+    initargs = (adjacency_mat, address_index, hash_map, truck, options)
+    if workers == 1:
+        _init_worker(*initargs)
+        tours = [_solve_cluster(cluster, cluster_rng) for cluster, cluster_rng in zip(clusters, rngs)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            tours = list(pool.map(_solve_cluster, clusters, rngs))
+
+    deadline_miles = stop_deadline_miles(truck, hash_map, address_index)
+    route = polish(stitch(tours, adjacency_mat, deadline_miles), adjacency_mat, deadline_miles)
+    if verbose:
+        print("Stitched and polished the cluster tours")
+    return route, route_cost(route, adjacency_mat, deadline_miles, 0)
+
+
+# pytest
+def test_cluster_genetic_algorithm():
+    import math
+
+    # Points on a grid of 4 groups far apart, the shortest route visits each group once
+    rng = random.Random(7)
+    points = [(0, 0)] + [
+        (cx + rng.uniform(0, 5), cy + rng.uniform(0, 5))
+        for cx, cy in ((10, 10), (10, 60), (60, 60), (60, 10))
+        for _ in range(30)
+    ]
+    adjacency_mat = [[math.dist(a, b) for b in points] for a in points]
+    stops = list(range(1, len(points)))
+
+    clusters = k_medoids(stops, adjacency_mat, 4)
+    assert sorted(len(cluster) for cluster in clusters) == [30, 30, 30, 30]
+    assert sorted(len({(stop - 1) // 30 for stop in cluster}) for cluster in clusters) == [1, 1, 1, 1]
+
+    # A cycle entered at its second stop and driven backwards
+    assert stitch([[1, 2, 3]], [[0, 5, 1, 5], [5, 0, 1, 1], [1, 1, 0, 3], [5, 1, 3, 0]]) == [2, 1, 3]
+
+    truck = Truck(1, 18, "HUB", "08:00:00")
+    route, score = cluster_genetic_algorithm(
+        stops, adjacency_mat, {}, HashTable(), truck, cluster_size=30, workers=1, rng=random.Random(1), num_iter=200
+    )
+    assert sorted(route) == stops
+    # Each group once: about 4 * 25 miles inside the groups and 4 * 50 miles between them
+    assert score < 400
+    assert score == route_cost(route, adjacency_mat, {}, 0)
@@ -0,0 +1,271 @@
+from Genetic import route_cost, stop_deadline_miles
+from HashTable import HashTable
+from Helper import convert_to_hours, hours_to_string, truck_finish_time
+from Truck import Truck
+
+"""Online dispatch of packages that arrive at the hub during the day. A new package goes into the route of the truck
+where it adds the fewest miles without making any package late, and only the delivery times after it change."""
+
+# Most positions apart that the local repair reverses after an insertion
+REPAIR_WINDOW = 4
+
+
+class Dispatcher:
+    """Insert new packages into the routes of trucks that are loaded and may already be driving. A truck that has not
+    left yet can take the package at any place in its route. A truck that is driving has to go back to the hub for
+    it, so the hub and the new stop are put in its route after the stop it is driving to. A truck that is back at the
+    hub for the day is not used."""
+
+    def __init__(self, trucks: list, adjacency_mat: list, address_index: dict, hash_map: HashTable) -> None:
+        """
+        :param trucks: trucks with their packages, route, departure time and finish time set, like plan_day leaves
+        them. truck.route is the list of address indexes without the hub at the start and end
+        :param adjacency_mat: matrix with the distances between the locations
+        :param address_index: dictionary with keys as the address string and the value as the index in the adjacency matrix
+        :param hash_map: hash table of the packages with key as the package id
+        """
+        self.trucks = trucks
+        self.adjacency_mat = adjacency_mat
+        self.address_index = address_index
+        self.hash_map = hash_map
+
+    def insert(self, package_id: int, now: str):
+        """
+        Put a package that is at the hub at time now on the truck where it is cheapest, with cheapest insertion. An
+        insertion is only possible when the truck has room, the new package is on time and the extra miles are not
+        more than the slack of the stops after it, the miles they can be late by before the first one misses its
+        deadline. Then a few 2-opt moves around the new stop shorten the route again, and the delivery times from the
+        new stop on are updated.
+        :param package_id: id of the package, already in hash_map
+        :param now: time the package is at the hub as "hh:mm:ss"
+        :return: the truck the package was put on, or None if no truck can deliver it on time
+        Big(O): O(n) for n stops on all the trucks, plus O(REPAIR_WINDOW * n) for the repair
+        """
+        package = self.hash_map.get_item(package_id)
+        stop = self.address_index[package.address]
+        now_hours = convert_to_hours(now)
+        best = None
+        for truck in self.trucks:
+            option = self._cheapest_insertion(truck, stop, package.deadline, now_hours)
+            if option is not None and (best is None or option[0] < best[0]):
+                best = option + (truck,)
+        if best is None:
+            return None
+
+        _, position, detour, truck = best
+        route = list(truck.route)
+        new_stops = [0, stop] if detour else [stop]
+        if stop not in route[position:position + 1]:
+            route[position:position] = new_stops
+        truck.packages.append(package_id)
+        package.truck_id = truck.id
+        deadline_miles = stop_deadline_miles(truck, self.hash_map, self.address_index)
+        # Only the stops after the new stop may be reordered, the hub has to stay before it
+        start = position + len(new_stops) - 1
+        route = self._repair(route, start, deadline_miles)
+
+        truck.route = route
+        truck.total_distance = route_cost(route, self.adjacency_mat, {}, 0)
+        truck.finish_time = truck_finish_time(truck, truck.total_distance)
+        # The repair leaves the stops before start as they are, so the first visit from start on is the new one
+        self._update_times(truck, position, package_id, route.index(stop, start))
+        if detour:
+            # The package leaves the hub when the truck comes back for it
+            hub_miles = route_cost(route[:position], self.adjacency_mat, {}, 0)
+            package.departure_time = hours_to_string(convert_to_hours(truck.departure_time) + hub_miles / truck.speed)
+        else:
+            package.departure_time = truck.departure_time
+        return truck
+
+    def _cheapest_insertion(self, truck: Truck, stop: int, deadline: str, now: float):
+        """Find the cheapest place for the stop in the route of the truck
+        :return: (extra miles, position in truck.route, True if the truck goes back to the hub first) or None
+        Big(O): O(n) for n stops on the truck"""
+        adjacency_mat = self.adjacency_mat
+        route = truck.route
+        departure = convert_to_hours(truck.departure_time)
+        driven = (now - departure) * truck.speed
+        budgets = stop_deadline_miles(truck, self.hash_map, self.address_index)
+        inf = float("inf")
+        budget = inf if deadline == "EOD" else (convert_to_hours(deadline) - departure) * truck.speed
+
+        miles = []
+        total = 0
+        previous = 0
+        for next_stop in route:
+            total += adjacency_mat[previous][next_stop]
+            miles.append(total)
+            previous = next_stop
+        if driven >= total + adjacency_mat[previous][0]:
+            return None
+
+        detour = driven > 0
+        if detour:
+            # The stops already reached and the one the truck is driving to stay as they are
+            first = min(sum(1 for reached in miles if reached <= driven) + 1, len(route))
+            on_board = sum(1 for package_id in truck.packages
+                           if miles[route.index(self._stop(package_id))] > driven)
+        else:
+            first = 0
+            on_board = len(truck.packages)
+            if stop in route and miles[route.index(stop)] <= budget:
+                # The package goes with the packages for the same address
+                if on_board < truck.max_package_capacity:
+                    return 0, route.index(stop), False
+        if on_board >= truck.max_package_capacity:
+            return None
+
+        # slack[i] is how many miles the stops from position i on can be pushed back and still be on time
+        slack = [inf] * (len(route) + 1)
+        for i in range(len(route) - 1, -1, -1):
+            slack[i] = min(slack[i + 1], budgets.get(route[i], inf) - miles[i])
+
+        best = None
+        for position in range(first, len(route) + 1):
+            previous = route[position - 1] if position > 0 else 0
+            following = route[position] if position < len(route) else 0
+            reached = miles[position - 1] if position > 0 else 0
+            if detour:
+                arrive = reached + adjacency_mat[previous][0] + adjacency_mat[0][stop]
+                added = adjacency_mat[previous][0] + adjacency_mat[0][stop] + adjacency_mat[stop][following]
+            else:
+                arrive = reached + adjacency_mat[previous][stop]
+                added = adjacency_mat[previous][stop] + adjacency_mat[stop][following]
+            added -= adjacency_mat[previous][following]
+            if arrive <= budget and added <= slack[position] and (best is None or added < best[0]):
+                best = (added, position, detour)
+        return best
+
+    def _repair(self, route: list, start: int, deadline_miles: dict) -> list:
+        """2-opt on the stops from start on, reversing at most REPAIR_WINDOW stops, when that makes the route
+        shorter and keeps every stop on time. Parts with the hub in them are not reversed.
+        Big(O): O(REPAIR_WINDOW * n) for each pass"""
+        cost = route_cost(route, self.adjacency_mat, deadline_miles, 0)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(start, len(route) - 1):
+                for j in range(i + 1, min(i + REPAIR_WINDOW, len(route))):
+                    if 0 in route[i:j + 1]:
+                        break
+                    candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                    candidate_cost = route_cost(candidate, self.adjacency_mat, deadline_miles, 0)
+                    if candidate_cost < cost:
+                        route, cost = candidate, candidate_cost
+                        improved = True
+        return route
+
+    def _update_times(self, truck: Truck, position: int, package_id: int, visit: int) -> None:
+        """Set the delivery time of the packages that are delivered at the stops from position on. A package is
+        delivered at the first visit to its address, and the new package at visit, the stop put in for it, so the
+        packages delivered before a second visit to the same address keep their time.
+        Big(O): O(n + m) for n stops and m packages on the truck"""
+        departure = convert_to_hours(truck.departure_time)
+        arrivals = []
+        first_visit = {}
+        miles = 0
+        previous = 0
+        for i, stop in enumerate(truck.route):
+            miles += self.adjacency_mat[previous][stop]
+            previous = stop
+            arrivals.append(departure + miles / truck.speed)
+            first_visit.setdefault(stop, i)
+        for other_id in truck.packages:
+            i = visit if other_id == package_id else first_visit[self._stop(other_id)]
+            if i >= position:
+                self.hash_map.get_item(other_id).delivery_time = hours_to_string(arrivals[i])
+
+    def _stop(self, package_id: int) -> int:
+        return self.address_index[self.hash_map.get_item(package_id).address]
+
+
+# pytest
+def test_dispatcher():
+    import random
+
+    from Package import Package
+
+    # Stops on a straight road, stop 5 is between stops 2 and 3
+    places = [0, 1, 2, 3, 4, 2.5]
+    adjacency_mat = [[abs(a - b) for b in places] for a in places]
+    address_index = {f"A{stop}": stop for stop in range(6)}
+    hash_map = HashTable()
+    hash_map.create_index("address")
+    for package_id, stop in ((1, 1), (2, 2), (3, 3), (4, 4), (10, 4)):
+        hash_map.insert(package_id, Package(package_id, f"A{stop}", "Salt Lake City", "UT", "84111", "EOD", "1", ""))
+    truck1 = Truck(1, 18, "A0", "08:00:00")
+    truck1.packages, truck1.route = [1, 2, 3, 4], [1, 2, 3, 4]
+    truck2 = Truck(2, 18, "A0", "12:00:00")
+    truck2.packages, truck2.route = [10], [4]
+    dispatcher = Dispatcher([truck1, truck2], adjacency_mat, address_index, hash_map)
+
+    # Truck 2 has not left and passes stop 5 on the way to stop 4 anyway
+    hash_map.insert(20, Package(20, "A5", "Salt Lake City", "UT", "84111", "EOD", "1", ""))
+    assert dispatcher.insert(20, "08:10:00") is truck2
+    assert truck2.route == [5, 4] and truck2.total_distance == 8
+
+    # With truck 2 full, truck 1 comes back to the hub for the package after its last stop
+    truck2.max_package_capacity = 2
+    hash_map.insert(21, Package(21, "A5", "Salt Lake City", "UT", "84111", "EOD", "1", ""))
+    assert dispatcher.insert(21, "08:10:00") is truck1
+    assert truck1.route == [1, 2, 3, 4, 0, 5] and truck1.total_distance == 13
+    assert hash_map.get_item(21).departure_time == "08:26:40"
+    assert hash_map.get_item(21).delivery_time == "08:35:00"
+    assert truck1.finish_time == "08:43:20"
+
+    # A driving truck comes back for a package to an address it has already been to, which keeps its time
+    hash_map.insert(5, Package(5, "A2", "Salt Lake City", "UT", "84111", "EOD", "1", ""))
+    truck3 = Truck(3, 18, "A0", "08:00:00")
+    truck3.packages, truck3.route = [1, 2, 3, 4], [1, 2, 3, 4]
+    for package_id, delivery_time in ((1, "08:03:20"), (2, "08:06:40"), (3, "08:10:00"), (4, "08:13:20")):
+        hash_map.get_item(package_id).delivery_time = delivery_time
+    detour = Dispatcher([truck3], adjacency_mat, address_index, hash_map)
+    assert detour.insert(5, "08:12:00") is truck3
+    assert truck3.route == [1, 2, 3, 4, 0, 2]
+    assert hash_map.get_item(2).delivery_time == "08:06:40"
+    assert hash_map.get_item(5).delivery_time == "08:33:20"
+
+    # No truck can be at stop 5 by 08:05
+    hash_map.insert(22, Package(22, "A5", "Salt Lake City", "UT", "84111", "08:05:00", "1", ""))
+    assert dispatcher.insert(22, "07:00:00") is None
+
+    # Many arrivals on bigger routes, every package gets a truck
+    rng = random.Random(1)
+    trucks, hash_map, dispatcher = _random_day(rng)
+    for package_id in range(1, 301):
+        _arrive(hash_map, dispatcher, package_id, rng)
+    assert sorted(p for truck in trucks for p in truck.packages) == list(range(1, 301))
+
+
+def _random_day(rng):
+    """Three trucks and a Dispatcher over 200 random addresses, for the test and the benchmark"""
+    places = [(rng.random() * 10, rng.random() * 10) for _ in range(201)]
+    adjacency_mat = [[abs(a[0] - b[0]) + abs(a[1] - b[1]) for b in places] for a in places]
+    address_index = {f"A{stop}": stop for stop in range(len(places))}
+    hash_map = HashTable(101)
+    trucks = [Truck(number, 18, "A0", f"{8 + number}:00:00") for number in range(1, 4)]
+    for truck in trucks:
+        truck.max_package_capacity = 1000
+    return trucks, hash_map, Dispatcher(trucks, adjacency_mat, address_index, hash_map)
+
+
+def _arrive(hash_map, dispatcher, package_id, rng):
+    """Add a package to a random address and dispatch it at 08:30"""
+    from Package import Package
+
+    address = f"A{rng.randrange(1, len(dispatcher.adjacency_mat))}"
+    hash_map.insert(package_id, Package(package_id, address, "Salt Lake City", "UT", "84111", "EOD", "1", ""))
+    assert dispatcher.insert(package_id, "08:30:00") is not None
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    # Arrivals a second on bigger routes
+    rng = random.Random(1)
+    trucks, hash_map, dispatcher = _random_day(rng)
+    start = time.perf_counter()
+    for package_id in range(1, 301):
+        _arrive(hash_map, dispatcher, package_id, rng)
+    print(f"{300 / (time.perf_counter() - start):.0f} arrivals/s")
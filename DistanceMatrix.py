@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+
+from Helper import create_distance_matrix
+
+"""Clean up the distance table before it is used by the solvers. The table is made symmetric and closed under
+shortest paths with Floyd-Warshall, so no direct hop is longer than going through another address. The addresses a
+shortened hop goes through are kept, to turn a route back into the real path, and the result is cached next to the
+CSV file so it is only computed when the table changes."""
+
+# A path through another address has to be shorter by more than this to replace the direct hop, so rounding in the
+# table does not add stops that save nothing
+EPSILON = 1e-9
+
+# Version of the cache format, a cache with another version is computed again
+CACHE_VERSION = 1
+
+
+def symmetrize(matrix: list) -> list:
+    """Fill every None cell from the other direction. When both directions have a distance, the shorter one is used
+    for both, and a pair without any distance is infinity. The distances are the same regardless of the direction
+    traveled, but the table only fills in one half.
+    :param matrix: square list of lists of floats or None, as made by create_distance_matrix
+    :return: new square list of lists of floats with zeros on the diagonal
+    Big(O): O(n^2)"""
+    size = len(matrix)
+    inf = float("inf")
+    result = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1, size):
+            distances = [d for d in (matrix[i][j], matrix[j][i]) if d is not None]
+            result[i][j] = result[j][i] = min(distances) if distances else inf
+    return result
+
+
+def shortest_paths(matrix: list):
+    """
+    Floyd-Warshall closure of a symmetric matrix. NumPy is used when it is installed, the pure Python loop gives the
+    same result.
+    :param matrix: square list of lists of floats
+    :return: the shortest distance between every pair as a list of lists, and next_hop, where next_hop[i][j] is the
+    address after i on the shortest path from i to j
+    Big(O): O(n^3)
+    """
+    try:
+        import numpy
+    except ImportError:
+        return _shortest_paths_python(matrix)
+
+    size = len(matrix)
+    distances = numpy.array(matrix, dtype=float)
+    next_hop = numpy.tile(numpy.arange(size), (size, 1))
+    for k in range(size):
+        through = distances[:, k, None] + distances[None, k, :]
+        shorter = through < distances - EPSILON
+        distances = numpy.where(shorter, through, distances)
+        next_hop = numpy.where(shorter, next_hop[:, k, None], next_hop)
+    return distances.tolist(), next_hop.tolist()
+
+
+def _shortest_paths_python(matrix: list):
+    """shortest_paths without NumPy
+    Big(O): O(n^3)"""
+    size = len(matrix)
+    distances = [list(row) for row in matrix]
+    next_hop = [list(range(size)) for _ in range(size)]
+    for k in range(size):
+        row_k = distances[k]
+        for i in range(size):
+            row_i = distances[i]
+            to_k = row_i[k]
+            hop = next_hop[i][k]
+            for j in range(size):
+                through = to_k + row_k[j]
+                if through < row_i[j] - EPSILON:
+                    row_i[j] = through
+                    next_hop[i][j] = hop
+    return distances, next_hop
+
+
+def expand_route(route: list, next_hop: list) -> list:
+    """Put the addresses that the shortest paths go through between the stops of a route
+    :param route: list of address indexes, with the hub at the ends if the path should start and end there
+    :param next_hop: from shortest_paths
+    :return: list of address indexes of the whole path
+    Big(O): O(n + k) for n stops and k addresses passed through"""
+    if not route:
+        return []
+    path = [route[0]]
+    for stop in route[1:]:
+        while path[-1] != stop:
+            path.append(next_hop[path[-1]][stop])
+    return path
+
+
+def load_distance_matrix(distance_csv: str, cache: bool = True):
+    """
+    Read the distance table, make it symmetric and close it under shortest paths. The result is kept in a JSON file
+    next to the CSV with the SHA-256 of the CSV, and used as long as the CSV does not change.
+    :param distance_csv: path of the distance table csv
+    :param cache: read and write the cache file
+    :return: the distance matrix and next_hop, see shortest_paths
+    Big(O): O(n^2) with a cache, O(n^3) without one
+    """
+    with open(distance_csv, "rb") as csv_file:
+        digest = hashlib.sha256(csv_file.read()).hexdigest()
+    cache_path = os.path.splitext(distance_csv)[0] + ".closure.json"
+    if cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path) as cache_file:
+                cached = json.load(cache_file)
+            if cached.get("version") == CACHE_VERSION and cached.get("sha256") == digest:
+                return cached["distances"], cached["next_hop"]
+        except (OSError, ValueError):
+            # A broken cache is computed again
+            pass
+
+    distances, next_hop = shortest_paths(symmetrize(create_distance_matrix(distance_csv)))
+    if cache:
+        # Write to a temporary file first, so a reader never sees half of the cache
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as cache_file:
+            json.dump({"version": CACHE_VERSION, "sha256": digest, "distances": distances, "next_hop": next_hop},
+                      cache_file)
+        os.replace(temp_path, cache_path)
+    return distances, next_hop
+
+
+# pytest
+def test_load_distance_matrix(tmp_path):
+    # A to C directly is 10, through B it is 3
+    distance_csv = tmp_path / "distance_table.csv"
+    distance_csv.write_text("0,None,None\n1,0,None\n10,2,0\n")
+
+    distances, next_hop = load_distance_matrix(str(distance_csv))
+    assert distances == [[0, 1, 3], [1, 0, 2], [3, 2, 0]]
+    assert expand_route([0, 2, 0], next_hop) == [0, 1, 2, 1, 0]
+    assert distances == _shortest_paths_python(symmetrize(create_distance_matrix(str(distance_csv))))[0]
+
+    # The second load comes from the cache, and a change to the CSV is seen
+    assert (tmp_path / "distance_table.closure.json").exists()
+    assert load_distance_matrix(str(distance_csv)) == (distances, next_hop)
+    distance_csv.write_text("0,None,None\n1,0,None\n2.5,2,0\n")
+    assert load_distance_matrix(str(distance_csv))[0][0][2] == 2.5
@@ -1,9 +1,8 @@
 import csv
 
-import openpyxl
-
 """This will convert the Excel files in the Excel folder into CSV and clean the data. This only needed to be run once and was not needed
-to determine the route for the truck"""
+to determine the route for the truck. openpyxl is only imported when a file is converted, so it is not needed to plan
+the routes."""
 
 
 def write_to_csv(output_path, list_to_write):
@@ -13,6 +12,8 @@ def write_to_csv(output_path, list_to_write):
 
 
 def packages_to_csv():
+    import openpyxl
+
     wb = openpyxl.load_workbook(r"ExcelFiles/WGUPS Package File.xlsx")
     ws = wb.active
     package_addresses = []
@@ -36,6 +37,8 @@ def packages_to_csv():
 
 
 def addresses_to_csv():
+    import openpyxl
+
     wb = openpyxl.load_workbook(r"ExcelFiles/WGUPS Distance Table.xlsx")
     ws = wb.active
 
@@ -62,6 +65,8 @@ def addresses_to_csv():
 
 
 def distance_table_to_csv():
+    import openpyxl
+
     wb = openpyxl.load_workbook(r"ExcelFiles/WGUPS Distance Table.xlsx")
     ws = wb.active
 
@@ -77,6 +82,7 @@ def distance_table_to_csv():
     write_to_csv("CSVFiles/distance_table.csv", distances)
 
 
-packages_to_csv()
-addresses_to_csv()
-distance_table_to_csv()
+if __name__ == "__main__":
+    packages_to_csv()
+    addresses_to_csv()
+    distance_table_to_csv()
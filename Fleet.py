@@ -0,0 +1,506 @@
+import re
+from array import array
+
+from Genetic import PENALTY, GeneticRoute
+from HashTable import HashTable
+from Helper import convert_to_hours, hours_to_string, truck_finish_time
+
+# Package 9 has the wrong address until WGUPS corrects it at 10:20 AM, so it cannot leave the hub before then
+ADDRESS_CORRECTION_TIME = "10:20:00"
+
+
+def package_constraints(hash_table: HashTable) -> dict:
+    """Read the special notes of the packages and turn them into rules the fleet split can check.
+    The notes that are understood are "Can only be on truck X", "Delayed on flight---will not arrive to depot until
+    h:mm am", "Must be delivered with X, Y" and "Wrong address listed".
+    :param hash_table: hash table of the packages with package id as the keys
+    :return: dictionary with package id as key and a dict of ready (hours), truck (id or None) and group (id or None)
+    Big(O): O(n) looping over all the packages, the groups are joined with a small union find
+    """
+    constraints = {}
+    group_of = {}
+
+    def find(package_id):
+        while group_of[package_id] != package_id:
+            group_of[package_id] = group_of[group_of[package_id]]
+            package_id = group_of[package_id]
+        return package_id
+
+    for package_id in hash_table.keys():
+        package = hash_table.get_item(package_id)
+        note = package.note
+        ready = convert_to_hours("08:00:00")
+        truck_id = None
+
+        truck_match = re.search(r"only be on truck (\d+)", note)
+        if truck_match:
+            truck_id = int(truck_match.group(1))
+
+        delay_match = re.search(r"until (\d+):(\d+) (am|pm)", note)
+        if delay_match:
+            hour = int(delay_match.group(1)) % 12
+            if delay_match.group(3) == "pm":
+                hour += 12
+            ready = hour + int(delay_match.group(2)) / 60
+
+        if "Wrong address" in note:
+            ready = convert_to_hours(ADDRESS_CORRECTION_TIME)
+
+        group_of.setdefault(package_id, package_id)
+        with_match = re.search(r"delivered with ([\d, ]+)", note)
+        if with_match:
+            for other_id in with_match.group(1).split(","):
+                other_id = int(other_id)
+                group_of.setdefault(other_id, other_id)
+                group_of[find(other_id)] = find(package_id)
+
+        constraints[package_id] = {"ready": ready, "truck": truck_id, "group": None}
+
+    # Only packages that share a group with another package keep a group id
+    members = {}
+    for package_id in constraints:
+        members.setdefault(find(package_id), []).append(package_id)
+    for root, group in members.items():
+        if len(group) > 1:
+            for package_id in group:
+                constraints[package_id]["group"] = root
+    return constraints
+
+
+def init_fleet_route(
+        package_ids,
+        adjacency_mat,
+        address_dict,
+        num_routes,
+        hash_table: HashTable,
+        trucks: list,
+        rng=None,
+        waits: set = None,
+):
+    """
+    Create the founders of the fleet genetic algorithm. Every chromosome is a giant tour of all the package ids, the
+    split in FleetRoute decides where one truck stops and the next one starts. A random tour almost never keeps the
+    grouped packages together on the right truck, so the founders are built with FleetRoute.seed_tour instead.
+    :param package_ids: list of all the package ids to be delivered by the fleet
+    :param adjacency_mat: the distance matrix of the addresses
+    :param address_dict: key value dict of address as keys and address index as value
+    :param num_routes: number of giant tours in the population
+    :param hash_table: hash table class that contains packages with the package ids
+    :param trucks: list of truck objects in the order they are filled by the split
+    :param rng: random.Random for the founders and the rest of the run, the random module if None
+    :param waits: ids of the trucks that wait for the truck before them, see FleetRoute
+    :return: FleetRoute class
+    Big(O): O(p * n^2) where p = n_population, see seed_tour
+    """
+    seeder = FleetRoute([], adjacency_mat, address_dict, hash_table, trucks, rng=rng, waits=waits)
+    initial_routes = [seeder.seed_tour(package_ids) for _ in range(num_routes)]
+    return FleetRoute(initial_routes, adjacency_mat, address_dict, hash_table, trucks, seeder.constraints, rng, waits)
+
+
+class FleetRoute(GeneticRoute):
+    """Genetic route over the whole fleet. The chromosome is a giant tour of package ids and the fitness is the cost of
+    the optimal split of that tour into one segment per truck. A truck in waits shares its driver with the truck before
+    it in trucks, so it leaves at its own departure time or when that truck is back, whichever is later."""
+
+    def __init__(
+            self,
+            bag,
+            adjacency_mat: list,
+            address_dict: dict,
+            hash_table: HashTable,
+            trucks: list,
+            constraints: dict = None,
+            rng=None,
+            waits: set = None,
+    ):
+        super().__init__(bag, adjacency_mat, address_dict, hash_table, None, rng)
+        self.trucks = trucks
+        self.waits = set(waits or ())
+        if constraints is None:
+            constraints = package_constraints(hash_table)
+        self.constraints = constraints
+
+        # Look up everything the split needs once, instead of once per chromosome
+        self.package_address = {}
+        self.package_deadline = {}
+        self.group_size = {}
+        for package_id in hash_table.keys():
+            package = hash_table.get_item(package_id)
+            self.package_address[package_id] = address_dict[package.address]
+            if package.deadline == "EOD":
+                self.package_deadline[package_id] = float("inf")
+            else:
+                self.package_deadline[package_id] = convert_to_hours(package.deadline)
+            group = constraints[package_id]["group"]
+            if group is not None:
+                self.group_size[group] = self.group_size.get(group, 0) + 1
+
+    def seed_tour(self, package_ids) -> list:
+        """
+        Build a random giant tour that already follows most of the rules. The packages that must go together are
+        kept as one unit, and every unit is put on a random truck that it is allowed on, that still has room and that
+        could make the deadline going straight from the hub.
+        Each truck then delivers its packages by deadline, and the packages with the same deadline are ordered with
+        nearest neighbor from a random first stop.
+        :param package_ids: list of all the package ids to deliver
+        :return: a giant tour of package ids with the trucks in the order of self.trucks
+        Big(O): O(n^2) for the nearest neighbor ordering
+        """
+        units = {}
+        for package_id in package_ids:
+            group = self.constraints[package_id]["group"]
+            units.setdefault(package_id if group is None else ("group", group), []).append(package_id)
+        units = list(units.values())
+        self.rng.shuffle(units)
+        # Place the units with the most rules first, while all the trucks still have room
+        units.sort(key=lambda u: -len(u) - sum(self.constraints[p]["truck"] is not None for p in u))
+
+        buckets = [[] for _ in self.trucks]
+        for unit in units:
+            candidates = []
+            for k, truck in enumerate(self.trucks):
+                departure = convert_to_hours(truck.departure_time)
+                if len(buckets[k]) + len(unit) > truck.max_package_capacity:
+                    continue
+                if all(
+                        departure >= self.constraints[p]["ready"]
+                        and self.constraints[p]["truck"] in (None, truck.id)
+                        and departure + self.adjacency_mat[0][self.package_address[p]] / truck.speed
+                        <= self.package_deadline[p]
+                        for p in unit
+                ):
+                    candidates.append(k)
+            if not candidates:
+                candidates = [k for k, truck in enumerate(self.trucks)
+                              if len(buckets[k]) + len(unit) <= truck.max_package_capacity]
+            buckets[self.rng.choice(candidates)].extend(unit)
+
+        tour = []
+        for bucket in buckets:
+            current = 0
+            for deadline in sorted(set(self.package_deadline[p] for p in bucket)):
+                batch = [p for p in bucket if self.package_deadline[p] == deadline]
+                self.rng.shuffle(batch)
+                while batch:
+                    if current == 0:
+                        package_id = batch[0]
+                    else:
+                        package_id = min(batch, key=lambda p: self.adjacency_mat[current][self.package_address[p]])
+                    batch.remove(package_id)
+                    tour.append(package_id)
+                    current = self.package_address[package_id]
+        return tour
+
+    def _segment_costs(self, chromosome, start: int, truck, departure: float = None):
+        """Walk the tour from start with one truck and yield (end, cost, miles) for every segment
+        chromosome[start:end] that fits in the truck. The cost is the round trip of miles from the hub plus a penalty
+        for every broken rule. Packages going to an address the truck has already visited are delivered on that
+        first visit.
+        :param departure: hours the truck leaves the hub, the departure time of the truck if None
+        Big(O): O(c) where c is the capacity of the truck"""
+        if departure is None:
+            departure = convert_to_hours(truck.departure_time)
+        visited = {}
+        current = 0
+        miles = 0
+        broken = 0
+        open_groups = 0
+        group_count = {}
+        for end in range(start, min(len(chromosome), start + truck.max_package_capacity)):
+            package_id = chromosome[end]
+            address_index = self.package_address[package_id]
+            if address_index in visited:
+                arrival = visited[address_index]
+            else:
+                miles += self.adjacency_mat[current][address_index]
+                current = address_index
+                visited[address_index] = miles
+                arrival = miles
+
+            rules = self.constraints[package_id]
+            if departure < rules["ready"]:
+                broken += 1
+            if rules["truck"] is not None and rules["truck"] != truck.id:
+                broken += 1
+            if departure + arrival / truck.speed > self.package_deadline[package_id]:
+                broken += 1
+
+            group = rules["group"]
+            if group is not None:
+                group_count[group] = group_count.get(group, 0) + 1
+                if group_count[group] == 1:
+                    open_groups += 1
+                if group_count[group] == self.group_size[group]:
+                    open_groups -= 1
+
+            round_trip = miles + self.adjacency_mat[current][0]
+            yield end + 1, round_trip + PENALTY * (broken + open_groups), round_trip
+
+    def _departure(self, k: int, previous_finish: float) -> float:
+        """Hours the k-th truck leaves the hub, previous_finish is when the truck before it is back, -inf if that
+        truck stays at the hub"""
+        departure = convert_to_hours(self.trucks[k].departure_time)
+        if k > 0 and self.trucks[k].id in self.waits:
+            return max(departure, previous_finish)
+        return departure
+
+    def split(self, chromosome):
+        """
+        Split the giant tour into consecutive segments, one per truck in the order of self.trucks, with dynamic
+        programming. A truck may get an empty segment. labels[k][i] are the ways to deliver the first i packages of the
+        tour with the first k trucks, as (cost, finish, start, parent): the k-th truck delivers chromosome[start:i]
+        and is back at finish, and parent is the way in labels[k - 1][start] it goes on from. Only the cheapest way is
+        kept, except before a truck that waits: a dearer way whose truck is back earlier can give the waiting truck
+        time to make its deadlines, so every way that no other way beats on both cost and finish is kept.
+        :param chromosome: a giant tour from bag
+        :return: the total cost of the split and a list of (start, end) slices of the tour, one for each truck
+        Big(O): O(k * n * c) for k trucks, n packages and a truck capacity of c, times the number of ways kept for a
+        truck that waits
+        """
+        size = len(chromosome)
+        no_finish = float("-inf")
+        labels = [[[] for _ in range(size + 1)]]
+        labels[0][0].append((0, no_finish, 0, None))
+
+        for k, truck in enumerate(self.trucks):
+            row = labels[k]
+            next_row = [[] for _ in range(size + 1)]
+            # The finish is only needed when the next truck waits for this one
+            keep_finish = k + 1 < len(self.trucks) and self.trucks[k + 1].id in self.waits
+            waits = k > 0 and truck.id in self.waits
+            for start in range(size + 1):
+                cell = row[start]
+                if not cell:
+                    continue
+                cheapest = min(range(len(cell)), key=lambda n: cell[n][0])
+                # The truck stays at the hub
+                _add_label(next_row[start], (cell[cheapest][0], no_finish, start, cheapest), keep_finish)
+                if start == size:
+                    continue
+                for n in range(len(cell)) if waits else (cheapest,):
+                    departure = self._departure(k, cell[n][1])
+                    for end, cost, miles in self._segment_costs(chromosome, start, truck, departure):
+                        label = (cell[n][0] + cost, departure + miles / truck.speed, start, n)
+                        _add_label(next_row[end], label, keep_finish)
+            labels.append(next_row)
+
+        cell = labels[-1][size]
+        if not cell:
+            return float("inf"), []
+        # Walk the parents back from the last truck to get the slices
+        n = min(range(len(cell)), key=lambda i: cell[i][0])
+        total = cell[n][0]
+        slices = []
+        end = size
+        for k in range(len(self.trucks), 0, -1):
+            _, _, start, parent = labels[k][end][n]
+            slices.append((start, end))
+            end, n = start, parent
+        slices.reverse()
+        return total, slices
+
+    def polish(self, chromosome) -> list:
+        """
+        Improve the route of every truck in the split with 2-opt, reversing a part of the truck's segment when that
+        makes the segment cheaper. The trucks keep the same packages, only the order inside each truck changes.
+        :param chromosome: a giant tour from bag
+        :return: the improved giant tour as a new list
+        Big(O): O(k * c^3) per pass for k trucks with a capacity of c
+        """
+        tour = list(chromosome)
+        _, slices = self.split(tour)
+        finish = float("-inf")
+        for k, (truck, (start, end)) in enumerate(zip(self.trucks, slices)):
+            departure = self._departure(k, finish)
+            best_cost, miles = self._segment_cost(tour[start:end], truck, departure)
+            improved = end - start >= 3
+            while improved:
+                improved = False
+                for i in range(start, end - 1):
+                    for j in range(i + 1, end):
+                        segment = tour[start:i] + tour[i:j + 1][::-1] + tour[j + 1:end]
+                        cost, segment_miles = self._segment_cost(segment, truck, departure)
+                        if cost < best_cost:
+                            tour[start:end] = segment
+                            best_cost, miles = cost, segment_miles
+                            improved = True
+            # The next truck may wait for this one, with the order it has now
+            finish = departure + miles / truck.speed if end > start else float("-inf")
+        return tour
+
+    def _segment_cost(self, segment, truck, departure: float = None):
+        """Cost and miles of one truck delivering the whole segment, see _segment_costs
+        Big(O): O(c)"""
+        cost, miles = float("inf"), 0
+        for _, cost, miles in self._segment_costs(segment, 0, truck, departure):
+            pass
+        return cost, miles
+
+    def fitness(self, chromosome, cutoff=float("inf")) -> float:
+        """
+        The cost of the optimal split of the giant tour. Tours that cannot be split over the fleet within the truck
+        capacities get the same cost as breaking a rule for every package.
+        :param chromosome: one of the giant tours from bag
+        :param cutoff: not used, the split needs the whole tour before it knows the cost of any of it
+        :return: total distance of all the trucks plus the penalties
+        Big(O): O(k * n * c), see split
+        """
+        cost, _ = self.split(chromosome)
+        if cost == float("inf"):
+            return PENALTY * len(chromosome)
+        return cost
+
+
+def _add_label(cell: list, label: tuple, keep_finish: bool) -> None:
+    """Add a (cost, finish, start, parent) way to a cell of FleetRoute.split. Without keep_finish the cell only keeps
+    the cheapest way, with it every way that no other way beats on both cost and finish
+    Big(O): O(m) for m ways in the cell"""
+    if not keep_finish:
+        if not cell:
+            cell.append(label)
+        elif label[0] < cell[0][0]:
+            cell[0] = label
+        return
+    cost, finish = label[0], label[1]
+    if any(other[0] <= cost and other[1] <= finish for other in cell):
+        return
+    cell[:] = [other for other in cell if not (cost <= other[0] and finish <= other[1])]
+    cell.append(label)
+
+
+def fleet_genetic_algorithm(
+        package_ids,
+        adjacency_mat,
+        address_index,
+        hash_map,
+        trucks,
+        num_population=25,
+        num_iter=300,
+        selectivity=0.15,
+        prob_cross=0.5,
+        prob_mut=0.2,
+        verbose=False,
+        rng=None,
+        waits: set = None,
+):
+    """Evolve a giant tour over all the packages and split it over the trucks. This lets the algorithm move a package
+    to a different truck to save miles, which the per truck genetic_algorithm cannot do.
+    :param package_ids: list of all the package ids to deliver
+    :param adjacency_mat: matrix with the distances between the locations
+    :param address_index: dictionary with keys as the address string and the value as the index in the adjacency matrix
+    :param hash_map: hash table of the packages with key as the package id
+    :param trucks: list of truck objects, filled in this order
+    :param num_population: the amount for the initial population
+    :param num_iter: number of iterations for the algorithm to complete
+    :param selectivity: probability to select a route
+    :param prob_cross: probability to do a cross-over
+    :param prob_mut: probability to do a swap
+    :param verbose: print the generation and the score to see progress
+    :param rng: random.Random that every random choice of the run comes from, the random module if None
+    :param waits: ids of the trucks that cannot leave before the truck before them in trucks is back, see FleetRoute
+    :return: the best giant tour and its cost
+    The departure times of the trucks are used as they are set, so set them before calling this function.
+    """
+    if len(package_ids) > sum(truck.max_package_capacity for truck in trucks):
+        raise ValueError("The trucks do not have enough capacity for all the packages")
+
+    route = init_fleet_route(package_ids, adjacency_mat, address_index, num_population, hash_map, trucks, rng, waits)
+    score = float("inf")
+    best = route.best
+    for i in range(num_iter):
+        route.select(num_population * selectivity)
+
+        if verbose:
+            if i % 100 == 0:
+                print(f"Generation - {i}: {score}")
+        if route.score < score:
+            # Polish the new best tour and put it back in the population so its children start from it
+            best = route.polish(route.best)
+            score = route.fitness(best)
+            route.parents[0] = array("H", best)
+        route.mutate(prob_cross, prob_mut)
+        route.next_generation()
+    return best, score
+
+
+def assign_fleet(route: FleetRoute, tour: list) -> float:
+    """Load the trucks with their segment of the giant tour and fill in the truck route, distance and finish time.
+    The truck route is the list of address indexes in the order they are visited, without the hub. A truck that
+    waits for the truck before it gets its later departure time.
+    :param route: the FleetRoute used to evolve the tour
+    :param tour: the best giant tour of package ids
+    :return: total distance of all the trucks
+    Big(O): O(k * n * c) for the split, then O(n) to load the trucks
+    """
+    _, slices = route.split(tour)
+    total_distance = 0
+    finish = float("-inf")
+    for k, (truck, (start, end)) in enumerate(zip(route.trucks, slices)):
+        departure = route._departure(k, finish)
+        if departure > convert_to_hours(truck.departure_time):
+            truck.departure_time = hours_to_string(departure)
+        truck.packages = list(tour[start:end])
+        truck.route = []
+        for package_id in truck.packages:
+            address_index = route.package_address[package_id]
+            if address_index not in truck.route:
+                truck.route.append(address_index)
+
+        stops = [0] + truck.route + [0]
+        truck.total_distance = sum(route.adjacency_mat[stops[i]][stops[i + 1]] for i in range(len(stops) - 1))
+        truck.finish_time = truck_finish_time(truck, truck.total_distance)
+        finish = convert_to_hours(truck.finish_time) if truck.packages else float("-inf")
+        total_distance += truck.total_distance
+    return total_distance
+
+
+# pytest
+def test_split():
+    from Package import Package
+    from Truck import Truck
+
+    hash_table = HashTable()
+    hash_table.insert(1, Package(1, "A", "Salt Lake City", "UT", "84115", "EOD", "1", "Can only be on truck 2"))
+    hash_table.insert(2, Package(2, "B", "Salt Lake City", "UT", "84115", "09:00:00", "1", "None"))
+    hash_table.insert(3, Package(3, "B", "Salt Lake City", "UT", "84115", "EOD", "1", "Must be delivered with 2"))
+    adjacency_mat = [[0, 1, 2], [1, 0, 2], [2, 2, 0]]
+    address_dict = {"HUB": 0, "A": 1, "B": 2}
+    trucks = [Truck(1, 18, "HUB", "08:00:00"), Truck(2, 18, "HUB", "09:05:00")]
+
+    route = FleetRoute([], adjacency_mat, address_dict, hash_table, trucks)
+    assert route.constraints[2]["group"] == route.constraints[3]["group"] is not None
+    assert route.constraints[1]["truck"] == 2
+
+    cost, slices = route.split([2, 3, 1])
+    assert cost == 6
+    assert slices == [(0, 2), (2, 3)]
+    # Package 1 cannot go on truck 1, so a tour that starts with it costs a penalty
+    assert route.fitness([1, 2, 3]) > PENALTY
+    assert assign_fleet(route, [2, 3, 1]) == 6
+    assert trucks[0].packages == [2, 3] and trucks[0].route == [2]
+    assert trucks[1].packages == [1] and trucks[1].route == [1]
+
+    # Truck 2 shares the driver of truck 1 and only has room for package 1. Package 1 is due at 08:10, a mile from the
+    # hub, which truck 2 only makes when it does not wait for truck 1 to drive to B and back
+    hash_table.get_item(1).deadline = "08:10:00"
+    trucks = [Truck(1, 18, "HUB", "08:00:00"), Truck(2, 18, "HUB", "08:00:00")]
+    trucks[1].max_package_capacity = 1
+    route = FleetRoute([], adjacency_mat, address_dict, hash_table, trucks)
+    assert route.split([2, 3, 1]) == (6, [(0, 2), (2, 3)])
+    route = FleetRoute([], adjacency_mat, address_dict, hash_table, trucks, waits={2})
+    assert route.split([2, 3, 1])[0] > PENALTY
+    assign_fleet(route, [2, 3, 1])
+    assert trucks[1].departure_time == trucks[0].finish_time == "08:13:20"
+
+    # Truck 3 waits for truck 2 and has package 6, due at 08:25 a mile from the hub. Truck 2 taking packages 4 and 5
+    # together is the cheapest way, but it is back at 08:30. Truck 1 taking package 4 costs 3 miles more and gets
+    # truck 2 back at 08:20, in time for truck 3
+    adjacency_mat = [[0, 3, 3, 1], [3, 0, 3, 3], [3, 3, 0, 3], [1, 3, 3, 0]]
+    address_dict = {"HUB": 0, "A": 1, "B": 2, "C": 3}
+    hash_table = HashTable()
+    hash_table.insert(4, Package(4, "A", "Salt Lake City", "UT", "84115", "EOD", "1", "None"))
+    hash_table.insert(5, Package(5, "B", "Salt Lake City", "UT", "84115", "EOD", "1", "Can only be on truck 2"))
+    hash_table.insert(6, Package(6, "C", "Salt Lake City", "UT", "84115", "08:25:00", "1", "Can only be on truck 3"))
+    trucks = [Truck(number, 18, "HUB", "08:00:00") for number in (1, 2, 3)]
+    route = FleetRoute([], adjacency_mat, address_dict, hash_table, trucks, waits={3})
+    assert route.split([4, 5, 6]) == (14, [(0, 1), (1, 2), (2, 3)])
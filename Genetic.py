@@ -1,10 +1,19 @@
+import hashlib
+import heapq
+import math
+import os
+import pickle
 import random
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
 
 from HashTable import HashTable
 from Package import Package
 from Truck import Truck
 
-random.seed(42)
+# Miles added to the cost of a route for every stop that misses its deadline, the same in every solver
+PENALTY = 10000
 
 
 # Create a population of some paths to start as the parents
@@ -15,6 +24,7 @@ def init_genetic_route(
         num_routes,
         hash_table: HashTable,
         truck: Truck,
+        rng=None,
 ):
     """
     Initiate the parents of the generic algorithm. These routes will be the founders of the where the algorithm
@@ -27,15 +37,22 @@ def init_genetic_route(
     :param num_routes: a list of lists that contain pacakge ids in random orders
     :param hash_table: hash table class that contains packages with the package ids
     :param truck: truck object of a single truck
+    :param rng: random.Random for the random orders and the rest of the run, the random module if None
     :return: Population class
 
     Big(O): O(n) since it will loop over all packages in the truck
     """
+    if rng is None:
+        rng = random
     i = 0
     initial_routes = []
+    seen = set()
+    # A short route does not have enough different orders to fill the population without repeats
+    unique = num_routes <= math.factorial(len(package_list))
     while i < num_routes:
-        rand_list = random.sample(package_list, len(package_list))
-        if rand_list not in initial_routes:
+        rand_list = rng.sample(package_list, len(package_list))
+        if not unique or tuple(rand_list) not in seen:
+            seen.add(tuple(rand_list))
             initial_routes.append(rand_list)
             i += 1
 
@@ -45,17 +62,29 @@ def init_genetic_route(
         address_dict,
         hash_table,
         truck,
+        rng,
     )
 
 
-def swap(chromosome):
+def spawn_rngs(rng, count: int) -> list:
+    """Make count random.Random streams seeded from rng, for solves that run side by side. The streams only depend
+    on the state of rng, so the same rng gives the same streams.
+    :param rng: random.Random, or the random module
+    :param count: number of streams
+    :return: list of random.Random
+    Big(O): O(count)"""
+    return [random.Random(rng.getrandbits(128)) for _ in range(count)]
+
+
+def swap(chromosome, rng=random):
     """
     Swap parts of the route
     :param chromosome: a route from bag
+    :param rng: random.Random or the random module
     :return: a different route
     Big(O): O(1)
     """
-    a, b = random.sample([x for x in range(len(chromosome))], 2)
+    a, b = rng.sample(range(len(chromosome)), 2)
     chromosome[a], chromosome[b] = (
         chromosome[b],
         chromosome[a],
@@ -63,6 +92,136 @@ def swap(chromosome):
     return chromosome
 
 
+def tournament_select(scores: list, k: int, size=3, rng=random) -> list:
+    """
+    Pick k indexes of scores. Each pick is the lowest score of size random routes.
+    :param scores: distance of each route
+    :param k: number of picks
+    :param size: number of routes in each tournament
+    :param rng: random.Random or the random module
+    :return: list of the picked indexes
+    Big(O): O(k * size), it does not depend on the number of routes
+    """
+    picked = []
+    for _ in range(k):
+        contestants = [rng.randrange(len(scores)) for _ in range(size)]
+        picked.append(min(contestants, key=scores.__getitem__))
+    return picked
+
+
+def roulette_select(probabilities: list, k: int, rng=random) -> list:
+    """
+    Pick k indexes at random, each with its probability. The prefix sums are built once and every pick is a binary
+    search in them.
+    :param probabilities: probability of each route, see GeneticRoute.evaluate
+    :param k: number of picks
+    :param rng: random.Random or the random module
+    :return: list of the picked indexes
+    Big(O): O(n) for the prefix sums, then O(log n) for each pick
+    """
+    prefix = list(accumulate(probabilities))
+    last = len(prefix) - 1
+    return [min(bisect_right(prefix, rng.random() * prefix[-1]), last) for _ in range(k)]
+
+
+class AdaptiveParameters:
+    """Change the crossover and mutation probabilities and the population size of a GeneticRoute during the run,
+    from how different the routes are (GeneticRoute.diversity) and how long ago the best score improved.
+    - While the score improves, the mutation goes back down to its start value and crossover goes up.
+    - When the routes become too alike, the mutation goes up and crossover goes down.
+    - When the score has not improved for stall_window generations, the population grows, and when it improves
+      again it shrinks back toward the start size.
+    - When the routes are almost all the same and the score has stalled, the population restarts from the elites.
+    """
+
+    def __init__(
+            self,
+            prob_cross: float,
+            prob_mut: float,
+            num_population: int,
+            max_population: int = None,
+            low_diversity: float = 0.3,
+            collapse_diversity: float = 0.1,
+            stall_window: int = 50,
+    ) -> None:
+        self.prob_cross = prob_cross
+        self.prob_mut = prob_mut
+        self.start_mut = prob_mut
+        self.num_population = num_population
+        self.min_population = num_population
+        self.max_population = max_population if max_population is not None else num_population * 2
+        self.low_diversity = low_diversity
+        self.collapse_diversity = collapse_diversity
+        self.stall_window = stall_window
+        self.stall = 0
+        self.restarts = 0
+
+    def update(self, route, improved: bool) -> None:
+        """Adjust the parameters after a generation, and resize or restart the population of route
+        :param route: the GeneticRoute after next_generation
+        :param improved: if the best score improved in this generation
+        Big(O): O(n * m) for the diversity of n routes of m stops"""
+        diversity = route.diversity()
+        if improved:
+            self.stall = 0
+            self.prob_mut = max(self.start_mut, self.prob_mut * 0.9)
+            self.prob_cross = min(0.9, self.prob_cross * 1.05)
+            self.num_population = max(self.min_population, int(self.num_population * 0.9))
+        else:
+            self.stall += 1
+
+        if diversity < self.low_diversity:
+            self.prob_mut = min(0.9, self.prob_mut * 1.2)
+            self.prob_cross = max(0.1, self.prob_cross * 0.95)
+
+        if self.stall and self.stall % self.stall_window == 0:
+            self.num_population = min(self.max_population, int(self.num_population * 1.5) + 1)
+            if diversity < self.collapse_diversity:
+                route.restart()
+                self.restarts += 1
+                self.prob_mut = self.start_mut
+
+        if self.num_population != len(route.bag):
+            route.resize(self.num_population)
+
+
+def save_checkpoint(path: str, state: dict) -> None:
+    """
+    Save the state of a genetic algorithm run with pickle. The file is written next to path first and then moved
+    over it, so a run that is stopped while saving never leaves a broken checkpoint.
+    :param path: file path of the checkpoint
+    :param state: dictionary with the population, best route, score, generation and random state
+    Big(O): O(n * m) for n routes of m stops
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        pickle.dump(state, file)
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path: str):
+    """Load a state saved by save_checkpoint, or None if there is no checkpoint at path
+    Big(O): O(n * m) for n routes of m stops"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def checkpoint_fingerprint(location_indexes, adjacency_mat, deadline_miles: dict, departure_time: str) -> str:
+    """SHA-256 of everything a saved score depends on besides the route: the distances between the hub and the stops,
+    the deadlines and the departure time. A checkpoint with another fingerprint was made for another problem.
+    :param location_indexes: list of the location indexes of the stops
+    :param adjacency_mat: matrix with the distances between the locations
+    :param deadline_miles: dictionary from stop_deadline_miles
+    :param departure_time: departure time of the truck as "hh:mm:ss"
+    Big(O): O(n^2) for n stops"""
+    places = [0] + sorted(location_indexes)
+    distances = [[adjacency_mat[i][j] for j in places] for i in places]
+    text = repr((places, distances, sorted(deadline_miles.items()), departure_time))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
 def _convert_to_hours(some_time: str) -> float:
     """Convert a string in the format of hh:mm:ss into hours as a float
     Big(O) = O(n) since split has to loop over the length of the string
@@ -74,8 +233,59 @@ def _convert_to_hours(some_time: str) -> float:
     return hrs
 
 
+def stop_deadline_miles(truck: Truck, hash_table: HashTable, address_dict: dict) -> dict:
+    """For every address on the truck with a deadline, the most miles the truck can drive after leaving the hub and
+    still deliver every package for that address on time. Addresses with only EOD packages are left out.
+    :param truck: truck object with the package ids and the departure time
+    :param hash_table: hash table class that contains packages with the package ids
+    :param address_dict: key value dict of address as keys and address index as value
+    :return: dictionary with the address index as key and the miles as value
+    Big(O): O(n) looping over the packages on the truck
+    """
+    departure = _convert_to_hours(truck.departure_time)
+    budgets = {}
+    for package_id in truck.packages:
+        package = hash_table.get_item(package_id)
+        if package.deadline == "EOD":
+            continue
+        miles = (_convert_to_hours(package.deadline) - departure) * truck.speed
+        address_index = address_dict[package.address]
+        budgets[address_index] = min(miles, budgets.get(address_index, float("inf")))
+    return budgets
+
+
+def route_cost(chromosome, adjacency_mat, deadline_miles: dict, min_return: float, cutoff=float("inf")) -> float:
+    """
+    Distance of a route from the hub through the stops and back to the hub, plus a PENALTY in miles for every stop
+    that is reached after its deadline. The route stops early when the distance so far plus min_return is more than
+    cutoff, because it cannot beat cutoff anymore. The early distance is still a lower bound of the whole route.
+    :param chromosome: list or array of the address indexes in the order of the route
+    :param adjacency_mat: matrix with the distances between the locations
+    :param deadline_miles: dictionary from stop_deadline_miles
+    :param min_return: shortest distance from any of the stops back to the hub
+    :param cutoff: distance that the route has to beat
+    :return: distance of the route plus the penalties, or a cost over cutoff if it stopped early
+    Big(O): O(n)
+    """
+    # The penalties are kept apart, only the miles driven are compared with the deadlines
+    miles = 0
+    penalties = 0
+    previous = 0
+    no_deadline = float("inf")
+    for stop in chromosome:
+        miles += adjacency_mat[previous][stop]
+        if miles > deadline_miles.get(stop, no_deadline):
+            penalties += PENALTY
+        if miles + penalties + min_return > cutoff:
+            return miles + penalties + min_return
+        previous = stop
+    return miles + adjacency_mat[previous][0] + penalties
+
+
 class GeneticRoute:
-    """This class will be used to determine a route for the trucks"""
+    """This class will be used to determine a route for the trucks. Each route in bag is stored in an unsigned short
+    array('H') instead of a list of ints, and the children are written into a second set of arrays (next_bag) that is
+    swapped with bag every generation, so the population is only allocated once."""
 
     def __init__(
             self,
@@ -84,9 +294,13 @@ class GeneticRoute:
             address_dict: dict,
             hash_table: HashTable,
             truck: Truck,
+            rng=None,
     ):
-        self.bag = bag
+        self.bag = [array("H", chromosome) for chromosome in bag]
+        self.next_bag = [array("H", chromosome) for chromosome in bag]
         self.parents = []
+        self.elite = 0
+        self.scores = []
         self.score = float('inf')
         self.best = None
         self.best_route_package_id = None
@@ -94,11 +308,28 @@ class GeneticRoute:
         self.address_dict = address_dict
         self.hash_table = hash_table
         self.truck = truck
+        self.cutoff = float('inf')
+        # ParallelFitness.FitnessPool to score the routes in worker processes, None to score them here
+        self.pool = None
+        # Every random choice of the run comes from rng, so runs with their own random.Random do not affect each other
+        self.rng = rng if rng is not None else random
+
+        # Look up the deadlines of the stops once, so fitness only compares the miles driven at each stop
+        self.deadline_miles = {}
+        # Every route ends with one of its stops back to the hub, so the closest one is a lower bound for the rest
+        self.min_return = 0
+        # A stop that is too far from the hub to make its deadline even as the first stop can never be on time
+        self.repairable = True
+        if truck is not None:
+            self.deadline_miles = stop_deadline_miles(truck, hash_table, address_dict)
+            if self.bag:
+                self.min_return = min(adjacency_mat[stop][0] for stop in self.bag[0])
+            self.repairable = all(adjacency_mat[0][stop] <= miles for stop, miles in self.deadline_miles.items())
 
     def address_index_to_package_id(self, address_index: int) -> Package:
         """Convert the address index to an address and then convert the address to the package
-        id by looping over the hash_table
-        Big(O) = O(n^2)"""
+        id with the address index of the hash_table
+        Big(O) = O(n) for the address dictionary"""
 
         address: str = ""
 
@@ -109,158 +340,345 @@ class GeneticRoute:
                 break
 
         # convert address to package id
-        for i in range(len(self.hash_table.data_map)):
-            if self.hash_table.data_map[i] is not None:
-                for j in range(len(self.hash_table.data_map[i])):
-                    package = self.hash_table.data_map[i][j][1]
-                    if package.address == address:
-                        return package
-
-    def fitness(self, chromosome) -> float:
+        packages = self.hash_table.find("address", address)
+        if packages:
+            return packages[0]
+
+    def fitness(self, chromosome, cutoff=float("inf")) -> float:
         """
         Test the distance of a random route and check to see if the package will be delivered by the delivery time.
-        If the package is not delivered, then the total distance will have a 1000-mile penalty.
+        If a stop is late, then the total distance will have a PENALTY in miles for that stop.
+        The route stops as soon as it can no longer be shorter than cutoff, see route_cost.
         :param chromosome: one of the routes from bag
-        :return: distance of the route
-        Big(O): O(n^3) There are 3 loops deep at the most
+        :param cutoff: distance that the route has to beat to be useful
+        :return: distance of the route, or a distance over cutoff if the route stopped early
+        Big(O): O(n) looping over the stops once
         """
-        total_distance = 0
-        # Copy the route, without reference in memory
-        full_route = chromosome.copy()
-        # Add the hub as the first element to be the starting location
-        full_route.insert(0, 0)
-        # Add the hub as the last element
-        full_route.append(0)
-
-        for i in range(len(full_route) - 1):
-            total_distance += self.adjacency_mat[full_route[i]][full_route[i + 1]]
-
-            # Loop over the route
-            if full_route[i] != 0:
-                # Get the index of the first stop
-                address_index = int(full_route[i])
-
-                address: str = ""
-                # Get the address of the address index
-                for key, value in self.address_dict.items():
-                    if address_index == value:
-                        address = key
-
-                # Get the packages that will be delivered at that address and that are on the same truck
-                # Always goes through every package in the hashtable O(n)
-                packages: list = []
-                for k in range(len(self.hash_table.data_map)):
-                    if self.hash_table.data_map[k] is not None:
-                        for j in range(len(self.hash_table.data_map[k])):
-                            package = self.hash_table.data_map[k][j][1]
-                            if package.address == address and package.id in self.truck.packages:
-                                packages.append(package)
-
-                # Loop over the packages at the specified address on the truck and determine the total_distance
-                for package in packages:
-                    deadline_str = package.deadline
-                    if deadline_str != "EOD":
-
-                        # Deliver time as hours
-                        time_to_delivery = total_distance / self.truck.speed
-
-                        # The total distance up to the address divided by the speed (18 mph) will determine
-                        # if the deadline can be met. If the deadline cannot be met, then add 500 miles to the route.
-                        deadline = _convert_to_hours(package.deadline)
-                        departure = _convert_to_hours(self.truck.departure_time)
-
-                        # Time to the deadline will be the deadline minus the departure in hours
-                        time_to_deadline = deadline - departure
-
-                        if time_to_deadline < time_to_delivery:
-                            total_distance += 10000
-                            break
-
-        return total_distance
+        return route_cost(chromosome, self.adjacency_mat, self.deadline_miles, self.min_return, cutoff)
 
-    def evaluate(self):
+    def repair(self, chromosome) -> bool:
         """
-        Rank the route based on the fitness of all the routes in bag
-        :return: the best route from bag
-        Big(O): O(n) looping over all route in bag to pass to fitness, then O(1) for the rest of evaulate
+        Move the stops that miss their deadline earlier in the route, until every stop is on time or it is clear
+        that the route cannot be fixed. For the first late stop, the closest stop before it with a later deadline is
+        moved behind it, and this repeats. A stop is never moved ahead of a stop with an earlier deadline, so it
+        ends after at most n^2 moves. If a deadline cannot be made even as the first stop, which repairable
+        checks with the hub row of the distance matrix, the route is not changed.
+        :param chromosome: a route from bag, changed in place
+        :return: True if every stop of the route is on time
+        Big(O): O(n) for a route that is on time, O(n^3) at most for one that has to be fixed
         """
-        distances = []
-        for chromosome in self.bag:
-            distance = self.fitness(chromosome=chromosome)
-            distances.append(distance)
+        if not self.deadline_miles:
+            return True
+        if not self.repairable:
+            return False
+        no_deadline = float("inf")
+        for _ in range(len(chromosome) ** 2):
+            # Find the first late stop and the miles at each stop before it
+            arrivals = []
+            miles = 0
+            previous = 0
+            late = -1
+            for position, stop in enumerate(chromosome):
+                miles += self.adjacency_mat[previous][stop]
+                if miles > self.deadline_miles.get(stop, no_deadline):
+                    late = position
+                    break
+                arrivals.append(miles)
+                previous = stop
+            if late == -1:
+                return True
+
+            # Move the closest stop before it with a later deadline (or none) to right after it, so the late stop
+            # and the stops between them are reached earlier
+            budget = self.deadline_miles[chromosome[late]]
+            for position in range(late - 1, -1, -1):
+                if self.deadline_miles.get(chromosome[position], no_deadline) > budget:
+                    chromosome.insert(late, chromosome.pop(position))
+                    break
+            else:
+                # Only stops with earlier deadlines are before it, moving them would not help
+                return False
+        return route_cost(chromosome, self.adjacency_mat, self.deadline_miles, 0) < PENALTY
 
+    def evaluate(self):
+        """
+        Rank the route based on the fitness of all the routes in bag. Routes that cannot beat self.cutoff stop early.
+        With a pool, the routes are scored by route_cost in its worker processes, so subclasses that change fitness
+        should not be given one.
+        :return: the probability of each route for roulette_select, shorter routes have a higher probability
+        Big(O): O(n) looping over all route in bag to pass to fitness, then O(n) to make the probabilities
+        """
+        if self.pool is not None:
+            distances = self.pool.evaluate(self.bag, self.deadline_miles, self.min_return, self.cutoff)
+        else:
+            distances = []
+            for chromosome in self.bag:
+                distance = self.fitness(chromosome, self.cutoff)
+                distances.append(distance)
+
+        self.scores = distances
         self.score = min(distances)
         self.best = self.bag[distances.index(self.score)]
-        self.parents.append(self.best)
-
-        # If there is only one element in distance
-        if len(distances) == 1:
-            distances = max(distances) - distances
 
-        for i in range(len(distances)):
-            # make an array of probability of distances
-            distances[i] = distances[i] / sum(distances)
-        return distances
-
-    def select(self, k=4):
-        """Select the parents of the next generation and append them to self.parent if it is above the random
-        distribution
-        Big(O): O(n)"""
+        # The fitness of a route is one over its distance, so a shorter route gets picked more often
+        fit = [1 / distance if distance > 0 else float("inf") for distance in distances]
+        if float("inf") in fit:
+            fit = [1.0 if f == float("inf") else 0.0 for f in fit]
+        total = sum(fit)
+        return [f / total for f in fit]
+
+    def select(self, k=4, method="tournament", elite=1, tournament_size=3):
+        """Select the parents of the next generation. The elite best routes are always parents, and are also copied
+        into the next generation without changes by mutate. The rest of the k parents are drawn with
+        tournament_select or roulette_select.
+        :param k: number of parents, rounded up
+        :param method: "tournament" or "roulette"
+        :param elite: number of best routes that are kept
+        :param tournament_size: number of routes in each tournament
+        Big(O): O(n) for evaluate, then O(log n) for each roulette draw or O(tournament_size) for each tournament"""
         fit = self.evaluate()
-        while len(self.parents) < k:
-            idx = random.randint(0, len(fit) - 1)
-            if fit[idx] > random.random():
-                self.parents.append(self.bag[idx])
+        self.elite = min(elite, len(self.bag))
+        order = heapq.nsmallest(self.elite, range(len(self.bag)), key=self.scores.__getitem__)
+        self.parents = [self.bag[idx] for idx in order]
+
+        draws = max(math.ceil(k) - len(self.parents), 0)
+        if method == "tournament":
+            picked = tournament_select(self.scores, draws, tournament_size, self.rng)
+        elif method == "roulette":
+            picked = roulette_select(fit, draws, self.rng)
+        else:
+            raise ValueError(f"Unknown selection method {method}")
+        self.parents.extend(self.bag[idx] for idx in picked)
 
     def crossover(self, p_cross=0.1):
         """
-        Randomly pick parts of the best route and randomly create different new routes based on the parent
+        Randomly pick parts of the best route and randomly create different new routes based on the parent.
+        The children are written into the arrays of next_bag, so no new routes are allocated.
         :param p_cross: probability to create a random part for another route
         :return: new routes for bag.
-        Big(O) = O(n(n+n)) which will come out to O(n^2) for the loops inside a loop
+        Big(O) = O(n) for each child, the stops that are already in the child are kept in a set
         """
-        children = []
+        children = self.next_bag
         # Get the dimensions of self.parents
-        count = len(self.parents)
         size = len(self.parents[0])
 
+        # The elites go to the next generation as they are
+        for child, parent in zip(children, self.parents[:self.elite]):
+            child[:] = parent
+
         # For all the routes in bag
-        for _ in range(len(self.bag)):
+        for child in children[self.elite:]:
             # By some change that p_cross is m
-            if random.random() > p_cross:
-                children.append(self.parents[random.randint(0, len(self.parents) - 1)])
+            if self.rng.random() > p_cross:
+                child[:] = self.parents[self.rng.randint(0, len(self.parents) - 1)]
             else:
                 # Select a random part of a route and fill it in with the missing stops
-                parent1, parent2 = random.sample(self.parents, 2)
-                idx = random.sample(range(size), 2)
+                parent1, parent2 = self.rng.sample(self.parents, 2)
+                idx = self.rng.sample(range(size), 2)
                 start, end = min(idx), max(idx)
-                child = [None] * size
-                for i in range(start, end + 1, 1):
-                    child[i] = parent1[i]
-
-                # Fill in the extra missing stops with address indexes that are not in child
-                pointer = 0
-                for i in range(size):
-                    if child[i] is None:
-                        while parent2[pointer] in child:
-                            pointer += 1
-                        child[i] = parent2[pointer]
-                children.append(child)
+                child[start:end + 1] = parent1[start:end + 1]
+                used = set(child[start:end + 1])
+
+                # Fill in the extra missing stops with address indexes that are not in child, in the order of parent2
+                missing = (stop for stop in parent2 if stop not in used)
+                for i in range(start):
+                    child[i] = next(missing)
+                for i in range(end + 1, size):
+                    child[i] = next(missing)
         return children
 
-    def mutate(self, prob_cross=0.1, prob_mut=0.1):
+    def mutate(self, prob_cross=0.1, prob_mut=0.1, repair=False):
         """
         This will call crossover to mix up the route and has a probably to swap some of the address indexes randomly
         :parm prob_cross: probability to create a random part for another route
         :parm prob_mut: probability to perform a swap on the route/chromosome
-        :return: next_bag a list of the next children of the previous generation
+        :parm repair: fix the deadlines of the children with repair before they are scored
+        :return: next_bag a list of the next children of the previous generation, call next_generation to use them
         Big(O): O(n) looping over the list of children
         """
-        bag2 = []
         children = self.crossover(prob_cross)
-        for child in children:
-            if random.random() < prob_mut:
-                bag2.append(swap(child))
-            else:
-                bag2.append(child)
-        return bag2
+        for child in children[self.elite:]:
+            if self.rng.random() < prob_mut:
+                swap(child, self.rng)
+            if repair:
+                self.repair(child)
+        return children
+
+    def diversity(self) -> float:
+        """Fraction of the routes in bag that are different from each other, 1 when they are all different
+        Big(O): O(n * m) for n routes of m stops"""
+        return len({chromosome.tobytes() for chromosome in self.bag}) / len(self.bag)
+
+    def resize(self, num_routes: int) -> None:
+        """
+        Change the number of routes in the population. New routes are random orders of the stops, and when the
+        population shrinks the routes at the end of bag are dropped, the elites are at the start.
+        :param num_routes: the new number of routes
+        Big(O): O(n * m) for n new routes of m stops
+        """
+        if num_routes < len(self.bag):
+            del self.bag[num_routes:]
+            del self.next_bag[num_routes:]
+        stops = self.bag[0].tolist()
+        while len(self.bag) < num_routes:
+            self.bag.append(array("H", self.rng.sample(stops, len(stops))))
+            self.next_bag.append(array("H", stops))
+
+    def restart(self) -> None:
+        """
+        Keep the elites at the start of bag and replace every other route with a random order of the stops, for
+        when the population has collapsed to copies of the same route.
+        Big(O): O(n * m) for n routes of m stops
+        """
+        stops = self.bag[0].tolist()
+        for chromosome in self.bag[max(self.elite, 1):]:
+            chromosome[:] = array("H", self.rng.sample(stops, len(stops)))
+
+    def next_generation(self) -> None:
+        """
+        Make the children from mutate the new bag. The arrays of the old bag are kept as next_bag and are
+        overwritten by the next call to crossover, so parents and best are only valid until then.
+        Big(O): O(1)
+        """
+        self.bag, self.next_bag = self.next_bag, self.bag
+        self.parents = []
+        self.scores = []
+        self.score = float('inf')
+        self.best = None
+
+
+# pytest
+def test_route_cost():
+    adjacency_mat = [
+        [0, 2, 9, 10],
+        [2, 0, 6, 4],
+        [9, 6, 0, 8],
+        [10, 4, 8, 0],
+    ]
+    assert route_cost([1, 2, 3], adjacency_mat, {}, 2) == 26
+    # Stop 2 is 8 miles in, a 5-mile deadline is missed once
+    assert route_cost([1, 2, 3], adjacency_mat, {2: 5}, 2) == 10026
+    # Stop 3 is 16 miles in, the late stop before it does not make it late too
+    assert route_cost([1, 2, 3], adjacency_mat, {2: 5, 3: 100}, 2) == PENALTY + 26
+    # After stop 2 the route is at 8 + 2 miles, which cannot beat 9, so it stops early with a lower bound
+    assert 9 < route_cost([1, 2, 3], adjacency_mat, {}, 2, cutoff=9) <= 26
+
+
+def test_select():
+    rng = random.Random(0)
+    scores = [50.0, 10.0, 40.0, 30.0, 20.0]
+    picked = tournament_select(scores, 1000, size=5, rng=rng)
+    # The best route wins most of the tournaments with 5 of the 5 routes
+    assert picked.count(1) > 500
+
+    picked = roulette_select([0.0, 0.75, 0.0, 0.25, 0.0], 1000, rng)
+    assert set(picked) == {1, 3}
+    assert picked.count(1) > picked.count(3)
+
+
+def test_adaptive_parameters():
+    adjacency_mat = [[abs(i - j) for j in range(6)] for i in range(6)]
+    route = GeneticRoute([[1, 2, 3, 4, 5]] * 20, adjacency_mat, {}, HashTable(), None, random.Random(0))
+    route.elite = 1
+    parameters = AdaptiveParameters(0.5, 0.2, 20, stall_window=2)
+    assert route.diversity() == 0.05
+
+    # Every route is the same, so the mutation goes up, and after stall_window generations without a better
+    # score the population grows and restarts from the elite
+    parameters.update(route, improved=False)
+    assert parameters.prob_mut > 0.2 and parameters.prob_cross < 0.5
+    parameters.update(route, improved=False)
+    assert parameters.restarts == 1
+    assert len(route.bag) == len(route.next_bag) == 31
+    assert route.diversity() > 0.5
+    assert route.bag[0].tolist() == [1, 2, 3, 4, 5]
+
+    parameters.update(route, improved=True)
+    assert parameters.stall == 0 and len(route.bag) == 27
+
+
+def test_checkpoint():
+    import tempfile
+
+    from Helper import genetic_algorithm
+
+    adjacency_mat = [[abs(i - j) + (i * j) % 7 for j in range(10)] for i in range(10)]
+    stops = list(range(1, 10))
+    truck = Truck(1, 18, "HUB")
+
+    expected = genetic_algorithm(stops, adjacency_mat, {}, HashTable(), truck, num_iter=60, exact_threshold=0,
+                                 rng=random.Random(3))
+
+    # The same run stopped after 30 generations and continued from its checkpoint gives the same route
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "truck1.checkpoint")
+        genetic_algorithm(stops, adjacency_mat, {}, HashTable(), truck, num_iter=30, exact_threshold=0,
+                          checkpoint_path=path, checkpoint_every=10, rng=random.Random(3))
+        assert load_checkpoint(path)["generation"] == 30
+        # The state of the stream comes from the checkpoint, not from the rng that is passed in
+        resumed = genetic_algorithm(stops, adjacency_mat, {}, HashTable(), truck, num_iter=60, exact_threshold=0,
+                                    checkpoint_path=path, rng=random.Random(99))
+        assert load_checkpoint(path)["generation"] == 60
+
+        # A checkpoint made for another departure time is not used, the run starts over
+        later = Truck(1, 18, "HUB", "08:29:00")
+        restarted = genetic_algorithm(stops, adjacency_mat, {}, HashTable(), later, num_iter=10, exact_threshold=0,
+                                      checkpoint_path=path, rng=random.Random(99))
+        assert load_checkpoint(path)["generation"] == 10
+        assert restarted == genetic_algorithm(stops, adjacency_mat, {}, HashTable(), later, num_iter=10,
+                                              exact_threshold=0, rng=random.Random(99))
+    assert resumed == expected
+
+
+def test_rng_streams():
+    import threading
+
+    from Helper import genetic_algorithm
+
+    adjacency_mat = [[abs(i - j) + (i * j) % 7 for j in range(12)] for i in range(12)]
+    stops = list(range(1, 12))
+
+    def solve(rng):
+        return genetic_algorithm(stops, adjacency_mat, {}, HashTable(), Truck(1, 18, "HUB"), num_iter=100,
+                                 exact_threshold=0, rng=rng)
+
+    expected = [solve(rng) for rng in spawn_rngs(random.Random(5), 4)]
+    # The same streams in threads at the same time give the same routes, and the random module is not used
+    state = random.getstate()
+    results = [None] * 4
+
+    def run(i, rng):
+        results[i] = solve(rng)
+
+    threads = [threading.Thread(target=run, args=(i, rng)) for i, rng in enumerate(spawn_rngs(random.Random(5), 4))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == expected
+    assert random.getstate() == state
+
+
+def test_repair():
+    from Package import Package
+
+    adjacency_mat = [[abs(i - j) for j in range(6)] for i in range(6)]
+    hash_table = HashTable()
+    # 18 mph, so the truck can drive 4.5 miles by 08:15 and 1.5 miles by 08:05
+    hash_table.insert(1, Package(1, "E", "Salt Lake City", "UT", "84115", "08:15:00", "1", "None"))
+    hash_table.insert(2, Package(2, "A", "Salt Lake City", "UT", "84115", "08:05:00", "1", "None"))
+    truck = Truck(1, 18, "HUB", "08:00:00")
+    truck.packages = [1, 2]
+    route = GeneticRoute([[5, 4, 3, 2, 1]], adjacency_mat, {"A": 1, "E": 4}, hash_table, truck)
+
+    chromosome = array("H", [5, 4, 3, 2, 1])
+    assert route.fitness(chromosome) > PENALTY
+    assert route.repair(chromosome)
+    assert route.fitness(chromosome) < PENALTY
+    assert chromosome[0] == 1 and sorted(chromosome) == [1, 2, 3, 4, 5]
+
+    # Stop 4 is 4 miles from the hub, a deadline of 08:10 (3 miles) cannot be made
+    hash_table.get_item(1).deadline = "08:10:00"
+    route = GeneticRoute([[5, 4, 3, 2, 1]], adjacency_mat, {"A": 1, "E": 4}, hash_table, truck)
+    assert not route.repairable
+    assert not route.repair(array("H", [5, 4, 3, 2, 1]))
@@ -1,7 +1,17 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from functools import partial
+
+
 class HashTable:
     """Custom python class that will create a hash table of some size (13 by default). Python's hash function is used
     to create the hash quickly. A prime number for size should be used to minimize collisions.
     Insert if O(1) look-ups are O(n) in worst case, but O(1) in best case.
+
+    Secondary indexes can be added on any attribute of the values with create_index (look up by equal value) and
+    create_range_index (look up by a range of values). Values that have add_listener, like Package, tell the table
+    when one of their attributes changes, so the indexes stay correct when a package is updated in place.
     """
 
     def __init__(self, size=31):
@@ -14,6 +24,11 @@ class HashTable:
         self.size = size
         self.entries = 0
         self.load_factor = self.entries / self.size
+        # field -> {attribute value: set of keys}
+        self.indexes: dict = {}
+        # field -> (function to make the attribute sortable, sorted list of (sortable value, key))
+        self.range_indexes: dict = {}
+        self._listeners: dict = {}
 
     def __hash(self, key: int) -> int:
         """Creates a hash of the key
@@ -27,13 +42,18 @@ class HashTable:
         :param key: package id
         :param value: the package object
         :return: None
-        Big(O): O(1)"""
+        Big(O): O(1), plus O(log n) for every range index"""
         index = self.__hash(key)
         if self.data_map[index] is None:
             self.data_map[index] = []
         self.data_map[index].append([key, value])
         self.entries += 1
 
+        self._index_item(key, value)
+        if hasattr(value, "add_listener"):
+            self._listeners[key] = partial(self._field_changed, key)
+            value.add_listener(self._listeners[key])
+
     def get_item(self, key: int):
         """Return an item from the hash table using the id of the package
         :param key: id of the pacakge
@@ -60,19 +80,35 @@ class HashTable:
         if self.data_map[index] is not None:
             for i in range(len(self.data_map[index])):
                 if self.data_map[index][i][0] == key:
+                    value = self.data_map[index][i][1]
+                    # Stop looping once the item is deleted, the bucket is shorter now
                     del self.data_map[index][i]
+                    self.entries -= 1
+                    self._unindex_item(key, value)
+                    if key in self._listeners:
+                        value.remove_listener(self._listeners.pop(key))
+                    return
 
     def keys(self) -> list:
         """Get a list of all the keys in the hash table
         :return list: of all keys
-        Big(O): O(n^2)"""
-        all_keys = []
-        # Loop over all the indexes
-        for i in range(len(self.data_map)):
-            if self.data_map[i] is not None:
-                for j in range(len(self.data_map[i])):
-                    all_keys.append(self.data_map[i][j][0])
-        return all_keys
+        Big(O): O(n) for n items, plus the number of buckets"""
+        return [key for key, _ in self.items()]
+
+    def items(self):
+        """Loop over all the (key, value) pairs in the hash table
+        Big(O): O(n) for n items, plus the number of buckets"""
+        for bucket in self.data_map:
+            if bucket is not None:
+                for key, value in bucket:
+                    yield key, value
+
+    def __len__(self) -> int:
+        return self.entries
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
 
     def print_table(self) -> None:
         for i, val in enumerate(self.data_map):
@@ -80,8 +116,240 @@ class HashTable:
 
     def get_number_of_packages(self) -> int:
         """Get the number of packages available in the hash table
-        Big(O):O(n^2) since it will call the keys function"""
-        return max(self.keys())
+        Big(O): O(1)"""
+        return len(self)
+
+    def create_index(self, field: str) -> None:
+        """Keep an index of the keys by the value of an attribute, for find
+        :param field: name of the attribute, for example "address"
+        Big(O): O(n) to index the items that are already in the table"""
+        self.indexes[field] = {}
+        for key, value in self.items():
+            self.indexes[field].setdefault(getattr(value, field, None), set()).add(key)
+
+    def create_range_index(self, field: str, sort_key=None) -> None:
+        """Keep the keys sorted by the value of an attribute, for find_range. Items where the attribute is None are
+        left out.
+        :param field: name of the attribute, for example "deadline"
+        :param sort_key: function that turns the attribute into something that can be sorted, like hours as a float
+        Big(O): O(n log n) to sort the items that are already in the table"""
+        if sort_key is None:
+            sort_key = _same
+        entries = [
+            (sort_key(getattr(value, field)), key)
+            for key, value in self.items()
+            if getattr(value, field, None) is not None
+        ]
+        entries.sort()
+        self.range_indexes[field] = (sort_key, entries)
+
+    def find(self, field: str, value) -> list:
+        """Get the items where the attribute is equal to value
+        :param field: name of the attribute
+        :param value: value to look for
+        :return: list of the items, in the order of their keys
+        Big(O): O(k log k) for k results when the field has an index, else O(n)"""
+        if field not in self.indexes:
+            return [item for key, item in sorted(self.items(), key=_first) if getattr(item, field, None) == value]
+        return [self.get_item(key) for key in sorted(self.indexes[field].get(value, ()))]
+
+    def find_range(self, field: str, low=None, high=None) -> list:
+        """Get the items where the attribute is between low and high, both included. The field needs a range index.
+        :param field: name of the attribute
+        :param low: lowest value, or None for no lower limit. Given in the same format as the attribute
+        :param high: highest value, or None for no upper limit
+        :return: list of the items, sorted by the attribute
+        Big(O): O(log n + k) for k results"""
+        sort_key, entries = self.range_indexes[field]
+        start = 0 if low is None else bisect_left(entries, (sort_key(low),))
+        results = []
+        for i in range(start, len(entries)):
+            if high is not None and entries[i][0] > sort_key(high):
+                break
+            results.append(self.get_item(entries[i][1]))
+        return results
+
+    def _index_item(self, key: int, value) -> None:
+        """Add an item to all the indexes
+        Big(O): O(1) for each index, O(log n) search for each range index"""
+        for field, index in self.indexes.items():
+            index.setdefault(getattr(value, field, None), set()).add(key)
+        for field, (sort_key, entries) in self.range_indexes.items():
+            if getattr(value, field, None) is not None:
+                insort(entries, (sort_key(getattr(value, field)), key))
+
+    def _unindex_item(self, key: int, value) -> None:
+        """Remove an item from all the indexes
+        Big(O): O(1) for each index, O(log n) search for each range index"""
+        for field in set(self.indexes) | set(self.range_indexes):
+            self._unindex_field(key, field, getattr(value, field, None))
+
+    def _unindex_field(self, key: int, field: str, old) -> None:
+        if field in self.indexes:
+            keys = self.indexes[field].get(old)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.indexes[field][old]
+        if field in self.range_indexes and old is not None:
+            sort_key, entries = self.range_indexes[field]
+            i = bisect_left(entries, (sort_key(old), key))
+            if i < len(entries) and entries[i] == (sort_key(old), key):
+                del entries[i]
+
+    def _field_changed(self, key: int, value, field: str, old, new) -> None:
+        """Called by a value when one of its attributes changes, moves the key in the indexes of that attribute"""
+        if field not in self.indexes and field not in self.range_indexes:
+            return
+        self._unindex_field(key, field, old)
+        if field in self.indexes:
+            self.indexes[field].setdefault(new, set()).add(key)
+        if field in self.range_indexes and new is not None:
+            sort_key, entries = self.range_indexes[field]
+            insort(entries, (sort_key(new), key))
+
+
+class ConcurrentHashTable(HashTable):
+    """HashTable that many threads can read and write at the same time, for plans that are changed while they are
+    served. A bucket is never changed in place: insert and remove_item build a new bucket list and put it in
+    data_map, so get_item and items read without a lock and always see a whole bucket. Writers lock one of the
+    stripes, the lock of bucket i is stripe i % stripes, so writers of different stripes do not wait for each other.
+    The entry count, indexes and listeners are shared by all the buckets and have one lock of their own, which
+    writers take while they hold the stripe lock, so a bucket and the indexes always change together. The stripe lock
+    is always taken before the index lock.
+    """
+
+    def __init__(self, size=31, stripes=8):
+        """
+        :param size: of the list. Recommended to be a prime number to properly reduce collisions.
+        :param stripes: number of locks for the buckets, more stripes let more writers work at the same time
+        """
+        super().__init__(size)
+        self._stripes = [threading.Lock() for _ in range(min(stripes, size))]
+        self._index_lock = threading.Lock()
+
+    def insert(self, key: int, value) -> None:
+        """Insert a package in the hashtable, see HashTable.insert
+        Big(O): O(k) to copy the bucket of k items, plus O(log n) for every range index"""
+        index = key % self.size
+        with self._stripes[index % len(self._stripes)]:
+            self.data_map[index] = (self.data_map[index] or []) + [[key, value]]
+            # Still under the stripe lock, so a remove of the same key cannot unindex it before it is indexed
+            with self._index_lock:
+                self.entries += 1
+                self._index_item(key, value)
+                if hasattr(value, "add_listener"):
+                    self._listeners[key] = partial(self._field_changed, key)
+                    value.add_listener(self._listeners[key])
+
+    def get_item(self, key: int):
+        """Return an item from the hash table using the id of the package, without a lock
+        Big(O): O(k) for a bucket of k items"""
+        # Read the bucket once, a writer replaces it instead of changing it
+        bucket = self.data_map[key % self.size]
+        if bucket is not None:
+            for item_key, value in bucket:
+                if item_key == key:
+                    return value
+        return None
+
+    def remove_item(self, key: int) -> None:
+        """Remove item from the hash table, see HashTable.remove_item
+        Big(O): O(k) to copy the bucket of k items"""
+        index = key % self.size
+        with self._stripes[index % len(self._stripes)]:
+            bucket = self.data_map[index] or []
+            for i, (item_key, value) in enumerate(bucket):
+                if item_key == key:
+                    self.data_map[index] = bucket[:i] + bucket[i + 1:]
+                    break
+            else:
+                return
+            with self._index_lock:
+                self.entries -= 1
+                self._unindex_item(key, value)
+                if key in self._listeners:
+                    value.remove_listener(self._listeners.pop(key))
+
+    def items(self):
+        """Loop over a snapshot of the (key, value) pairs, the items inserted or removed during the loop may or may not
+        be in it
+        Big(O): O(n) for n items, plus the number of buckets"""
+        for bucket in list(self.data_map):
+            if bucket is not None:
+                for key, value in bucket:
+                    yield key, value
+
+    def create_index(self, field: str) -> None:
+        with self._index_lock:
+            super().create_index(field)
+
+    def create_range_index(self, field: str, sort_key=None) -> None:
+        with self._index_lock:
+            super().create_range_index(field, sort_key)
+
+    def find(self, field: str, value) -> list:
+        with self._index_lock:
+            if field in self.indexes:
+                keys = sorted(self.indexes[field].get(value, ()))
+            else:
+                keys = None
+        if keys is None:
+            return super().find(field, value)
+        # An item removed after the keys were read is left out
+        return [item for item in map(self.get_item, keys) if item is not None]
+
+    def find_range(self, field: str, low=None, high=None) -> list:
+        with self._index_lock:
+            sort_key, entries = self.range_indexes[field]
+            start = 0 if low is None else bisect_left(entries, (sort_key(low),))
+            keys = []
+            for i in range(start, len(entries)):
+                if high is not None and entries[i][0] > sort_key(high):
+                    break
+                keys.append(entries[i][1])
+        return [item for item in map(self.get_item, keys) if item is not None]
+
+    def _field_changed(self, key: int, value, field: str, old, new) -> None:
+        with self._index_lock:
+            super()._field_changed(key, value, field, old, new)
+
+
+def throughput(table: HashTable, num_threads: int = 4, num_operations: int = 60000) -> float:
+    """Measure how many operations per second the threads get through together. The threads share the operations,
+    every thread inserts, reads and removes its own keys, with four reads for every write.
+    :param table: an empty table
+    :param num_threads: number of threads
+    :param num_operations: operations of all the threads together
+    :return: operations per second
+    Big(O): O(num_operations)"""
+    num_keys = num_operations // 6
+
+    def work(thread):
+        keys = range(thread, num_keys, num_threads)
+        for key in keys:
+            table.insert(key, key)
+        for _ in range(4):
+            for key in keys:
+                table.get_item(key)
+        for key in keys:
+            table.remove_item(key)
+
+    threads = [threading.Thread(target=work, args=(thread,)) for thread in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return num_keys * 6 / (time.perf_counter() - start)
+
+
+def _same(value):
+    return value
+
+
+def _first(pair):
+    return pair[0]
 
 
 # pytest
@@ -103,6 +371,12 @@ def fill_hash_table():
     return my_hash_table
 
 
+class _Movie:
+    def __init__(self, title, year):
+        self.title = title
+        self.year = year
+
+
 def test_get_items():
     my_hash_table = fill_hash_table()
     assert my_hash_table.get_item(1) == "Citizen Kane - 1941"
@@ -112,3 +386,125 @@ def test_get_items():
     assert my_hash_table.get_item(5) == "Lawrence of Arabia - 1962"
     assert max(my_hash_table.keys()) == 5
     assert my_hash_table.get_number_of_packages() == 5
+
+
+def test_remove_item():
+    my_hash_table = fill_hash_table()
+    # Keys 1 and 5 are in the same bucket of a table of size 4
+    my_hash_table.remove_item(1)
+    assert my_hash_table.get_item(1) is None
+    assert my_hash_table.get_item(5) == "Lawrence of Arabia - 1962"
+    assert len(my_hash_table) == 4
+    assert sorted(my_hash_table.keys()) == [2, 3, 4, 5]
+
+
+def test_indexes():
+    from Package import Package
+
+    my_hash_table = HashTable(4)
+    my_hash_table.create_index("address")
+    my_hash_table.create_range_index("year")
+    my_hash_table.insert(1, Package(1, "300 State St", "Salt Lake City", "UT", "84103", "EOD", "2", "None"))
+    my_hash_table.insert(2, Package(2, "300 State St", "Salt Lake City", "UT", "84103", "EOD", "2", "None"))
+    my_hash_table.insert(3, _Movie("Casablanca", 1942))
+    my_hash_table.insert(4, _Movie("Citizen Kane", 1941))
+    my_hash_table.insert(5, _Movie("The Godfather", 1972))
+
+    assert [p.id for p in my_hash_table.find("address", "300 State St")] == [1, 2]
+    # The index follows the change of the attribute
+    my_hash_table.get_item(2).address = "410 S State St"
+    assert [p.id for p in my_hash_table.find("address", "300 State St")] == [1]
+    assert [p.id for p in my_hash_table.find("address", "410 S State St")] == [2]
+    my_hash_table.remove_item(1)
+    assert my_hash_table.find("address", "300 State St") == []
+
+    assert [m.title for m in my_hash_table.find_range("year", 1940, 1950)] == ["Citizen Kane", "Casablanca"]
+    assert [m.title for m in my_hash_table.find_range("year", low=1950)] == ["The Godfather"]
+    my_hash_table.remove_item(4)
+    assert [m.title for m in my_hash_table.find_range("year", 1940, 1950)] == ["Casablanca"]
+    assert dict(my_hash_table.items())[3].year == 1942
+
+
+def test_concurrent_hash_table():
+    table = ConcurrentHashTable(31)
+    table.create_index("year")
+    table.create_range_index("year")
+    # Keys that stay in the table the whole time, the readers must always find them
+    for key in range(0, 1000, 10):
+        table.insert(key, _Movie(str(key), key % 3))
+    errors = []
+
+    def writer(thread):
+        for round_number in range(20):
+            keys = [key for key in range(1000) if key % 10 and key % 4 == thread]
+            for key in keys:
+                table.insert(key, _Movie(str(key), key % 3))
+            for key in keys:
+                if table.get_item(key).title != str(key):
+                    errors.append(key)
+            for key in keys:
+                table.remove_item(key)
+
+    def reader():
+        for _ in range(50):
+            for key in range(0, 1000, 10):
+                if table.get_item(key) is None:
+                    errors.append(key)
+            if sum(1 for _ in table.items()) < 100:
+                errors.append("items")
+
+    threads = [threading.Thread(target=writer, args=(thread,)) for thread in range(4)]
+    threads += [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(table) == 100
+    assert sorted(table.keys()) == list(range(0, 1000, 10))
+    assert len(table.find("year", 1)) == len([key for key in range(0, 1000, 10) if key % 3 == 1])
+    assert len(table.find_range("year", 0, 2)) == 100
+    assert throughput(ConcurrentHashTable(), 2, 600) > 0
+
+
+def test_concurrent_insert_remove_same_keys():
+    import sys
+
+    table = ConcurrentHashTable(31)
+    table.create_index("year")
+    table.create_range_index("year")
+
+    def worker(thread):
+        # Every thread inserts and removes the same keys, with its own year
+        for _ in range(200):
+            for key in range(20):
+                table.insert(key, _Movie(str(key), thread))
+                table.remove_item(key)
+
+    interval = sys.getswitchinterval()
+    # Switch threads often, so the inserts and removes of a key interleave
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert len(table) == 0
+    assert table.indexes["year"] == {} and table.range_indexes["year"][1] == []
+    # A key inserted again is only found under its new value
+    table.insert(1, _Movie("1", 1972))
+    assert [m.year for year in range(4) for m in table.find("year", year)] == []
+    assert [m.title for m in table.find("year", 1972)] == ["1"]
+
+
+if __name__ == "__main__":
+    # Big enough for short buckets, so the numbers show the locking and not the bucket scans
+    size = 4099
+    print(f"HashTable, 1 thread: {throughput(HashTable(size), 1):,.0f} ops/s")
+    for threads in (1, 2, 4, 8):
+        print(f"ConcurrentHashTable, {threads} threads: {throughput(ConcurrentHashTable(size), threads):,.0f} ops/s")
@@ -0,0 +1,199 @@
+from operator import add
+
+from Genetic import PENALTY, stop_deadline_miles
+from HashTable import HashTable
+from Truck import Truck
+
+
+def held_karp(
+        location_indexes,
+        adjacency_mat,
+        address_index,
+        hash_map: HashTable,
+        truck: Truck,
+):
+    """
+    Exact route for a truck with the Held-Karp dynamic program over subsets of the stops. best[mask][j] is the
+    shortest distance from the hub that visits the stops in mask and ends at stop j. A state that gets to stop j
+    after its deadline is dropped, a shorter way to the same state always gets there earlier, so the route found is
+    the shortest one that makes every deadline. If no route makes every deadline, the route with the fewest late stops
+    and then the fewest miles is found with _late_route, which is the lowest cost with the same PENALTY
+    the genetic algorithm gives for every late stop.
+    :param location_indexes: list of the location indexes (values in the address_dict)
+    :param adjacency_mat: matrix with the distances between the locations
+    :param address_index: dictionary with keys as the address string and the value as the index in the adjacency matrix
+    :param hash_map: hash table of the packages with key as the package id
+    :param truck: truck object
+    :return: the best route as a list of location indexes and its distance
+    Big(O): O(2^n * n^2) for n stops, the inner minimum over the previous stops is done with map in one call
+    """
+    stops = list(location_indexes)
+    if not stops:
+        return [], 0
+    budgets = stop_deadline_miles(truck, hash_map, address_index)
+    budget = [budgets.get(stop, float("inf")) for stop in stops]
+
+    best = _subset_distances(stops, adjacency_mat, budget)
+    if best is None:
+        # No route makes every deadline
+        return _late_route(stops, adjacency_mat, budget)
+    return _best_route(stops, adjacency_mat, best)
+
+
+def _subset_distances(stops: list, adjacency_mat: list, budget: list):
+    """Fill the Held-Karp table, with the states that miss a deadline set to infinity.
+    :return: the table as a list with one list of distances for every subset, or None if every full route is late
+    Big(O): O(2^n * n^2)"""
+    size = len(stops)
+    inf = float("inf")
+    # column[j][i] is the distance from stop i to stop j
+    column = [[adjacency_mat[i][j] for i in stops] for j in stops]
+    best = [None] * (1 << size)
+    best[0] = [inf] * size
+    for mask in range(1, 1 << size):
+        row = [inf] * size
+        for j in range(size):
+            bit = 1 << j
+            if not mask & bit:
+                continue
+            previous = mask ^ bit
+            if previous == 0:
+                distance = adjacency_mat[0][stops[j]]
+            else:
+                distance = min(map(add, best[previous], column[j]))
+            if distance <= budget[j]:
+                row[j] = distance
+        best[mask] = row
+    if min(best[-1]) == inf:
+        return None
+    return best
+
+
+def _late_route(stops: list, adjacency_mat: list, budget: list):
+    """
+    Route with the lowest miles + PENALTY * late stops, for when no route makes every deadline. A way to a state with
+    fewer miles but more late stops can still be the better one once later stops are late, so every state keeps all
+    the (late, miles) pairs that no other pair beats on both, with the stop before it to walk the route back.
+    :return: the route as a list of location indexes and its cost
+    Big(O): O(2^n * n^2 * d) for n stops, with d the most pairs kept in a state, at most one more than the number of
+    stops with a deadline
+    """
+    size = len(stops)
+    column = [[adjacency_mat[i][j] for i in stops] for j in stops]
+    # labels[mask][j] is a list of (late, miles, previous stop, index of the label in labels[mask ^ (1 << j)])
+    labels = [None] * (1 << size)
+    for mask in range(1, 1 << size):
+        row = []
+        for j in range(size):
+            bit = 1 << j
+            if not mask & bit:
+                row.append(None)
+                continue
+            previous = mask ^ bit
+            if previous == 0:
+                miles = adjacency_mat[0][stops[j]]
+                row.append([(int(miles > budget[j]), miles, None, None)])
+                continue
+            candidates = []
+            to_j = column[j]
+            for i, cell in enumerate(labels[previous]):
+                if cell is None:
+                    continue
+                for n, (late, miles, _, _) in enumerate(cell):
+                    miles += to_j[i]
+                    candidates.append((late + (miles > budget[j]), miles, i, n))
+            # Sorted by late stops and then miles, a pair is kept when it has fewer miles than every pair before it
+            candidates.sort()
+            kept = []
+            for candidate in candidates:
+                if not kept or candidate[1] < kept[-1][1]:
+                    kept.append(candidate)
+            row.append(kept)
+        labels[mask] = row
+
+    mask = (1 << size) - 1
+    cost, j, n = min(
+        (late * PENALTY + miles + adjacency_mat[stops[j]][0], j, n)
+        for j in range(size)
+        for n, (late, miles, _, _) in enumerate(labels[mask][j])
+    )
+    order = []
+    while j is not None:
+        order.append(j)
+        _, _, i, n_previous = labels[mask][j][n]
+        mask ^= 1 << j
+        j, n = i, n_previous
+    order.reverse()
+    return [stops[j] for j in order], cost
+
+
+def _best_route(stops: list, adjacency_mat: list, best: list):
+    """Close the tour back to the hub and walk the table backwards to get the order of the stops.
+    Big(O): O(n^2)"""
+    size = len(stops)
+    mask = (1 << size) - 1
+    distance, last = min((best[mask][j] + adjacency_mat[stops[j]][0], j) for j in range(size))
+    order = [last]
+    while mask != 1 << last:
+        previous = mask ^ (1 << last)
+        # The stop before last is the one that the table used to get the distance to last
+        target = best[mask][last]
+        last = min(
+            (i for i in range(size) if previous & (1 << i)),
+            key=lambda i: abs(best[previous][i] + adjacency_mat[stops[i]][stops[last]] - target),
+        )
+        order.append(last)
+        mask = previous
+    order.reverse()
+    return [stops[j] for j in order], distance
+
+
+# pytest
+def test_held_karp():
+    from itertools import permutations
+
+    from Package import Package
+
+    adjacency_mat = [
+        [0, 2, 9, 10, 7],
+        [2, 0, 6, 4, 3],
+        [9, 6, 0, 8, 5],
+        [10, 4, 8, 0, 6],
+        [7, 3, 5, 6, 0],
+    ]
+    truck = Truck(1, 18, "HUB", "08:00:00")
+    route, distance = held_karp([1, 2, 3, 4], adjacency_mat, {}, HashTable(), truck)
+    shortest = min(
+        sum(adjacency_mat[a][b] for a, b in zip((0,) + order, order + (0,))) for order in permutations([1, 2, 3, 4])
+    )
+    assert distance == shortest
+    assert sorted(route) == [1, 2, 3, 4]
+
+    # Stop 2 has to be reached within 9 miles (08:30 at 18 mph), so it has to be the first stop
+    hash_table = HashTable()
+    hash_table.insert(1, Package(1, "C", "Salt Lake City", "UT", "84115", "08:30:00", "1", "None"))
+    truck.packages = [1]
+    route, distance = held_karp([1, 2, 3, 4], adjacency_mat, {"C": 2}, hash_table, truck)
+    assert route[0] == 2
+    assert distance < PENALTY
+
+    # Stops 2 and 3 both have to be first, so one is late. The shortest route ignoring deadlines is late at both
+    hash_table.insert(2, Package(2, "D", "Salt Lake City", "UT", "84115", "08:33:20", "1", "None"))
+    truck.packages = [1, 2]
+    budgets = {2: 9, 3: 10}
+    route, distance = held_karp([1, 2, 3, 4], adjacency_mat, {"C": 2, "D": 3}, hash_table, truck)
+    best = min(_cost(order, adjacency_mat, budgets) for order in permutations([1, 2, 3, 4]))
+    assert distance == best == _cost(route, adjacency_mat, budgets)
+    assert PENALTY < distance < 2 * PENALTY
+
+
+def _cost(route, adjacency_mat, budgets):
+    """miles + PENALTY * late stops of a route, to check held_karp against every order"""
+    miles = 0
+    late = 0
+    previous = 0
+    for stop in route:
+        miles += adjacency_mat[previous][stop]
+        late += miles > budgets.get(stop, float("inf"))
+        previous = stop
+    return miles + adjacency_mat[previous][0] + PENALTY * late
@@ -1,16 +1,36 @@
 import csv
-
-from Genetic import *
+import random
+import time
+
+from Genetic import (
+    AdaptiveParameters, GeneticRoute, checkpoint_fingerprint, init_genetic_route, load_checkpoint, save_checkpoint,
+    stop_deadline_miles,
+)
+from HashTable import HashTable
+from HeldKarp import held_karp
+from Package import Package
 from Truck import Truck
 
 
+# Attributes of Package that the supervisor can look up with HashTable.find, and with HashTable.find_range. The status
+# is not kept, it depends on the time and is found from departure_time and delivery_time, see
+# Report.packages_with_status
+PACKAGE_INDEXES = ["address", "zipcode", "city", "deadline", "truck_id"]
+PACKAGE_RANGE_INDEXES = ["deadline", "departure_time", "delivery_time"]
+
+
 def fill_hash_table(packages_csv: str) -> HashTable:
-    """Fill hashtable with the package objects, using the package's id as the key.
+    """Fill hashtable with the package objects, using the package's id as the key. The table keeps an index of the
+    packages on every attribute in PACKAGE_INDEXES and PACKAGE_RANGE_INDEXES.
     :param packages_csv: string path to the packages.csv
     :return: HashTable of the package objects
     Big(O): O(n) looping over the csv file line by line to fill the hashTable
     """
     hash_table = HashTable()
+    for field in PACKAGE_INDEXES:
+        hash_table.create_index(field)
+    for field in PACKAGE_RANGE_INDEXES:
+        hash_table.create_range_index(field, time_key)
     with open(packages_csv) as file:
         csv_file = csv.reader(file)
         for index, line in enumerate(csv_file):
@@ -45,6 +65,14 @@ def convert_to_hours(some_time: str) -> float:
     return hrs
 
 
+def time_key(some_time: str) -> float:
+    """Sort key for a deadline or a delivery time, EOD goes after every time of the day
+    Big(O): O(1)"""
+    if some_time == "EOD":
+        return float("inf")
+    return convert_to_hours(some_time)
+
+
 def create_address_dict(addresses_csv_path):
     """Create a dictionary of the address and their index. The address is the key and the index are the value.
     This will be used in the package look up and for the distance table lookup, the higher value will go to
@@ -108,9 +136,21 @@ def genetic_algorithm(
         selectivity=0.15,
         prob_cross=0.5,
         prob_mut=0.2,
-        verbose=False
+        verbose=False,
+        exact_threshold=16,
+        selection="tournament",
+        elite=1,
+        adaptive=False,
+        checkpoint_path=None,
+        checkpoint_every=100,
+        repair=True,
+        pool=None,
+        time_limit=None,
+        history=None,
+        rng=None,
 ):
-    """Method to call the genetic algorith to find an optimal route
+    """Method to call the genetic algorith to find an optimal route. Routes with up to exact_threshold stops are
+    solved exactly with held_karp instead, which is the shortest route that makes the deadlines
     :param location_indexes: list of the location indexes (values in the address_dict)
     :param adjacency_mat: matrix with the distances between the locations
     :param address_index: dictionary with keys as the address string and the value as the index in the adjacency matrix
@@ -122,29 +162,112 @@ def genetic_algorithm(
     :param prob_cross: probability to do a cross-over
     :param prob_mut: probability to do a swap
     :param verbose: print the generation and the score to see progress
+    :param exact_threshold: most stops to solve with held_karp, 16 stops takes about a second. Use 0 to always use
+    the genetic algorithm
+    :param selection: "tournament" or "roulette", see GeneticRoute.select
+    :param elite: number of best routes kept unchanged in every generation
+    :param adaptive: change prob_cross, prob_mut and the population size during the run, see AdaptiveParameters.
+    The given values are where they start
+    :param checkpoint_path: file to save the population, best route, random state and generation to every
+    checkpoint_every generations and at the end. If the file already has a run for the same stops, distances,
+    deadlines and departure time, the run continues from it up to num_iter generations in total, so a run can be
+    resumed or given more iterations. A run for anything else is started over
+    :param checkpoint_every: number of generations between checkpoints
+    :param repair: move late stops earlier in every new route before it is scored, see GeneticRoute.repair
+    :param pool: ParallelFitness.FitnessPool to score the population in worker processes, worth it for large
+    populations. The pool can be shared by the trucks and by runs in other threads, it only needs the same distance
+    matrix. The runs take turns to use it, see FitnessPool
+    :param time_limit: seconds to run for at most, the run stops after the generation that goes over it
+    :param history: list to add (seconds, generation, score) to every time the best score improves, and once more at
+    the end with the number of generations that ran
+    :param rng: random.Random that every random choice of the run comes from, so runs at the same time in one process
+    do not change each other's results. The random module if None
     """
-    # location_indexes = np.array(location_indexes)
-
-    route = init_genetic_route(
-        location_indexes, adjacency_mat, address_index, num_population, hash_map, truck
-    )
-    score = float("inf")
-    best = route.best
-    for i in range(num_iter):
-        route.select(num_population * selectivity)
+    started = time.perf_counter()
+    if rng is None:
+        rng = random
+    if len(location_indexes) <= exact_threshold:
+        if verbose:
+            print(f"Exact route for {len(location_indexes)} stops")
+        best, score = held_karp(location_indexes, adjacency_mat, address_index, hash_map, truck)
+        if history is not None:
+            history.append((time.perf_counter() - started, 0, score))
+        return best, score
+
+    checkpoint = None
+    fingerprint = None
+    if checkpoint_path is not None:
+        checkpoint = load_checkpoint(checkpoint_path)
+        deadline_miles = stop_deadline_miles(truck, hash_map, address_index)
+        fingerprint = checkpoint_fingerprint(location_indexes, adjacency_mat, deadline_miles, truck.departure_time)
+    if checkpoint is not None and checkpoint.get("fingerprint") == fingerprint:
+        if verbose:
+            print(f"Resuming from generation {checkpoint['generation']} of {checkpoint_path}")
+        route = GeneticRoute(checkpoint["bag"], adjacency_mat, address_index, hash_map, truck, rng)
+        best, score = checkpoint["best"], checkpoint["score"]
+        route.cutoff = score
+        parameters = checkpoint["parameters"]
+        prob_cross, prob_mut = checkpoint["prob_cross"], checkpoint["prob_mut"]
+        start = checkpoint["generation"]
+        rng.setstate(checkpoint["random_state"])
+    else:
+        route = init_genetic_route(
+            location_indexes, adjacency_mat, address_index, num_population, hash_map, truck, rng
+        )
+        if repair:
+            for chromosome in route.bag:
+                route.repair(chromosome)
+        score = float("inf")
+        best = route.best
+        parameters = None
+        if adaptive:
+            parameters = AdaptiveParameters(prob_cross, prob_mut, num_population)
+        start = 0
+    route.pool = pool
+
+    def save(generation):
+        save_checkpoint(checkpoint_path, {
+            "stops": list(location_indexes),
+            "fingerprint": fingerprint,
+            "bag": [chromosome.tolist() for chromosome in route.bag],
+            "best": best,
+            "score": score,
+            "generation": generation,
+            "parameters": parameters,
+            "prob_cross": prob_cross,
+            "prob_mut": prob_mut,
+            "random_state": rng.getstate(),
+        })
+
+    for i in range(start, num_iter):
+        route.select(len(route.bag) * selectivity, selection, elite)
 
         if verbose:
             if i % 100 == 0:
                 print(f"Generation - {i}: {score}")
-        if route.score < score:
-            best = route.best
+        improved = route.score < score
+        if improved:
+            # Copy the route, the arrays of bag are reused for the next children
+            best = route.best.tolist()
             score = route.score
-        children = route.mutate(prob_cross, prob_mut)
-        route = GeneticRoute(
-            children, route.adjacency_mat, address_index, hash_map, truck
-        )
-        # best.insert(0, 0)
-        # best.append(0)
+            # Only the routes that can still beat the best score are walked to the end
+            route.cutoff = score
+            if history is not None:
+                history.append((time.perf_counter() - started, i, score))
+        route.mutate(prob_cross, prob_mut, repair)
+        route.next_generation()
+        if parameters is not None:
+            parameters.update(route, improved)
+            prob_cross, prob_mut = parameters.prob_cross, parameters.prob_mut
+        if checkpoint_path is not None and (i + 1) % checkpoint_every == 0:
+            save(i + 1)
+        if time_limit is not None and time.perf_counter() - started > time_limit:
+            num_iter = i + 1
+            break
+    if checkpoint_path is not None:
+        save(max(start, num_iter))
+    if history is not None:
+        history.append((time.perf_counter() - started, max(start, num_iter), score))
     return best, score
 
 
@@ -167,7 +290,7 @@ def hours_to_string(some_time: float) -> str:
     hours = int(some_time - (some_time % 1))
     minutes = (some_time % 1) * 60
     seconds = (minutes % 1) * 60
-    minutes = int(round(minutes, 0))
+    minutes = int(minutes)
     seconds = int(round(seconds, 0))
     if seconds == 60:
         minutes += 1
@@ -233,13 +356,7 @@ def delivery_times(
                     break
 
             # convert to package id
-            packages = []
-            for i in range(len(hash_table.data_map)):
-                if hash_table.data_map[i] is not None:
-                    for j in range(len(hash_table.data_map[i])):
-                        package = hash_table.data_map[i][j][1]
-                        if package.address == address and package.id in truck.packages:
-                            packages.append(package)
+            packages = [p for p in hash_table.find("address", address) if p.id in truck.packages]
             stop_route_package = []
             delivery_time = 0
             # Loop over packages and set the departure and delivery time in the package object
@@ -262,54 +379,23 @@ def display_package_data_at_time(some_time: str, hash_table: HashTable):
     """Loop over all the packages in the hashtable to check the delivery
     times against some_time. Since we will already know what time the package
     will be delivered, check to see if the delivery time of the package is less
-    than or equal to some_time.
+    than or equal to some_time. The table is made and written by Report.write_package_report.
     :param some_time: string format that the user will enter as "hh:mm:ss"
     :param hash_table: hash table of the packages with package id as the keys
     :return: None, it will print the status of all the packages.
     Big(O): O(n)
     """
-    some_time_float = convert_to_hours(some_time)
+    # Report imports this module, so it is imported when it is used
+    from Report import write_package_report
 
     # Check for package_id number 9, if some_time is less than 10:20 then
     # it is the original address
-    if convert_to_hours("10:20:00") > some_time_float:
+    if convert_to_hours("10:20:00") > convert_to_hours(some_time):
         hash_table.get_item(9).address = "300 State St"
     else:
         hash_table.get_item(9).address = "410 S State St"
 
-    # Loop over all the packages in the hashtable to check
-    # Since we will already know what time the package will be delivered,
-    # check to see if the delivery time of the package is less than or
-    # equal to some_time
-    table_list = []
-    package_id_list = [id for id in range(1, hash_table.get_number_of_packages() + 1)]
-    package_id_list.sort()
-
-    for package_id in package_id_list:
-        package = hash_table.get_item(package_id)
-        temp = [package.id, package.address, package.city, package.zipcode, package.truck_id]
-
-        package_delivery = convert_to_hours(package.delivery_time)
-        if package_delivery <= some_time_float:
-            temp.append("Delivered")
-            temp.append(package.deadline)
-            temp.append(package.delivery_time)
-        elif convert_to_hours(package.departure_time) <= some_time_float:
-            temp.append("In Route")
-            temp.append(package.deadline)
-            temp.append(f"ETA: {package.delivery_time}")
-        else:
-            temp.append("At Hub")
-            temp.append(package.deadline)
-            temp.append(f"ETA: {package.delivery_time}")
-        table_list.append(temp)
-
-    print(f"Package status table at {some_time}:")
-
-    for row in table_list:
-        print(
-            f"Package ID: {row[0]} | Truck ID: {row[4]} | Address: {row[1]}, {row[2]}, {row[3]} | Deadline: {row[6]} | "
-            f"Status: {row[5]} | Time of Delivery: {row[7]}")
+    write_package_report(some_time, hash_table)
 
 
 def fill_package_truck_id(hash_table: HashTable, truck: Truck) -> None:
@@ -323,24 +409,23 @@ def fill_package_truck_id(hash_table: HashTable, truck: Truck) -> None:
         package.truck_id = truck.id
 
 
-def display_all_trucks_distance(some_time: str, t1: Truck, t2: Truck, t3: Truck) -> None:
-    t_list = [t1, t2, t3]
-    d_list = []
-    for t in t_list:
-        depart_time = convert_to_hours(t.departure_time)
-        finish_time = convert_to_hours(t.finish_time)
-        current_time = convert_to_hours(some_time)
-        if finish_time < current_time:
-            total_time = finish_time - depart_time
-        else:
-            total_time = current_time - depart_time
-        if total_time <= 0:
-            d_list.append(0)
-        else:
-            d_list.append(total_time * t.speed)
-    print(f"Distance (miles) traveled by all trucks at {some_time}:\n"
-          f"\tTruck1: {d_list[0]:.2f} miles\n"
-          f"\tTruck2: {d_list[1]:.2f} miles\n"
-          f"\tTruck3: {d_list[2]:.2f} miles\n"
-          f"\tTotal: {sum(d_list):.2f} miles\n"
-          )
+def display_all_trucks_distance(some_time: str, *trucks: Truck) -> None:
+    """Print the miles driven by every truck at some_time, for any number of trucks
+    :param some_time: string format that the user will enter as "hh:mm:ss"
+    :param trucks: the truck objects
+    :return: None
+    Big(O): O(n) for n trucks
+    """
+    from Report import write_truck_report
+
+    write_truck_report(some_time, list(trucks))
+
+
+# pytest
+def test_hours_to_string():
+    assert hours_to_string(8.5) == "08:30:00"
+    # The minutes are cut, not rounded, 26.67 minutes is 08:26:40 and not 08:27:40
+    assert hours_to_string(8 + 26 / 60 + 40 / 3600) == "08:26:40"
+    # Seconds that round up to 60 carry into the minutes and the hours
+    assert hours_to_string(9 + 59 / 60 + 59.9 / 3600) == "10:00:00"
+    assert hours_to_string(13.25) == "13:15:00"
@@ -21,8 +21,11 @@ class Package:
         :param deadline: (str) deadline of when the package must be delivered, in the format of "hh:mm:ss"
         :param weight: (int) weight of the package in pounds
         :param note: (str) text of the notes of the package
-        :param status: (str) of the package, at the hub, en route or delivered
+
+        Listeners added with add_listener are called as listener(package, field, old, new) when an attribute changes,
+        the HashTable uses this to keep its indexes up to date.
         """
+        self._listeners = []
         self.id = package_id
         self.address = address
         self.city = city
@@ -35,10 +38,22 @@ class Package:
         self.delivery_time = None
         self.truck_id = None
 
+    def __setattr__(self, field, value) -> None:
+        old = self.__dict__.get(field)
+        object.__setattr__(self, field, value)
+        if field != "_listeners":
+            for listener in self._listeners:
+                listener(self, field, old, value)
+
+    def add_listener(self, listener) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener) -> None:
+        self._listeners.remove(listener)
+
     def __str__(self) -> str:
         return (
             f"\nPackage ID: {self.id}\n"
-            f"\tStatus: {self.status}\n"
             f"\tDelivery Address: {self.address} {self.city}, UT, {self.zipcode}\n"
             f"\tDeadline: {self.deadline}\n"
             f"\tWeight: {self.weight}\n"
@@ -0,0 +1,195 @@
+import os
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from Genetic import route_cost
+
+"""Fitness of a population in worker processes. The distance matrix and the deadlines of the stops are put in shared
+memory once, so the workers read them without a copy. The routes go to the workers as bytes of their array('H') and
+only the scores come back."""
+
+# Chunks of the population for every worker in one evaluate, a few so a slow worker does not hold up the rest
+CHUNKS_PER_WORKER = 2
+
+# Shared memory of the worker process, set once by _attach
+_worker = {}
+
+
+class FitnessPool:
+    """Persistent process pool that scores routes with route_cost, for GeneticRoute.pool. Use it in a with block or
+    call close, which also frees the shared memory. There is one deadline buffer for all the workers, so evaluate
+    calls from several threads take turns and each one is scored with its own deadlines."""
+
+    def __init__(self, adjacency_mat: list, workers: int = None):
+        """
+        :param adjacency_mat: square matrix with the distances between the locations
+        :param workers: number of worker processes, one for each CPU if None
+        Big(O): O(n^2) to copy the matrix of n locations into shared memory
+        """
+        self.size = len(adjacency_mat)
+        self.workers = workers or os.cpu_count() or 1
+        item = array("d").itemsize
+        self._matrix = shared_memory.SharedMemory(create=True, size=self.size * self.size * item)
+        self._deadlines = shared_memory.SharedMemory(create=True, size=self.size * item)
+        matrix = self._matrix.buf.cast("d")
+        for i, row in enumerate(adjacency_mat):
+            matrix[i * self.size:(i + 1) * self.size] = array("d", row)
+        matrix.release()
+        self._deadline_miles = None
+        # Held from loading the deadlines until the scores are back, the workers read the deadlines the whole time
+        self._lock = threading.RLock()
+        self.load_deadlines({})
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_attach,
+            initargs=(self._matrix.name, self._deadlines.name, self.size),
+        )
+
+    def load_deadlines(self, deadline_miles: dict) -> None:
+        """Put the deadlines of a truck in shared memory, only when they are different from the last ones
+        :param deadline_miles: dictionary from stop_deadline_miles
+        Big(O): O(n) for n locations"""
+        with self._lock:
+            if deadline_miles == self._deadline_miles:
+                return
+            deadlines = self._deadlines.buf.cast("d")
+            deadlines[:] = array("d", [float("inf")] * self.size)
+            for stop, miles in deadline_miles.items():
+                deadlines[stop] = miles
+            deadlines.release()
+            self._deadline_miles = dict(deadline_miles)
+
+    def evaluate(self, bag: list, deadline_miles: dict, min_return: float, cutoff=float("inf")) -> list:
+        """
+        Score every route of bag with route_cost in the worker processes.
+        :param bag: list of routes as array('H'), all with the same stops
+        :param deadline_miles: dictionary from stop_deadline_miles
+        :param min_return: shortest distance from any of the stops back to the hub
+        :param cutoff: distance that the routes have to beat
+        :return: list of the scores in the order of bag
+        Big(O): O(p * m / w) for p routes of m stops and w workers
+        """
+        if not bag:
+            return []
+        length = len(bag[0])
+        step = -(-len(bag) // (self.workers * CHUNKS_PER_WORKER))
+        chunks = [b"".join(chromosome.tobytes() for chromosome in bag[i:i + step]) for i in range(0, len(bag), step)]
+        scores = []
+        with self._lock:
+            self.load_deadlines(deadline_miles)
+            for result in self._pool.map(_score_chunk, chunks, [length] * len(chunks), [min_return] * len(chunks),
+                                         [cutoff] * len(chunks)):
+                scores.extend(array("d", result))
+        return scores
+
+    def close(self) -> None:
+        """Stop the workers and free the shared memory"""
+        self._pool.shutdown()
+        self._matrix.close()
+        self._matrix.unlink()
+        self._deadlines.close()
+        self._deadlines.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _attach(matrix_name: str, deadlines_name: str, size: int) -> None:
+    """Open the shared memory in a worker and keep a memoryview of every row of the matrix, so route_cost can index
+    it like the list of lists"""
+    matrix = shared_memory.SharedMemory(name=matrix_name)
+    deadlines = shared_memory.SharedMemory(name=deadlines_name)
+    values = matrix.buf.cast("d")
+    _worker.update(
+        memory=(matrix, deadlines),
+        rows=[values[i * size:(i + 1) * size] for i in range(size)],
+        deadlines=deadlines.buf.cast("d"),
+    )
+
+
+def _score_chunk(chunk: bytes, length: int, min_return: float, cutoff: float) -> bytes:
+    """Score the routes of one chunk in a worker
+    :return: the scores as bytes of an array('d')"""
+    routes = array("H")
+    routes.frombytes(chunk)
+    no_deadline = float("inf")
+    deadline_miles = {stop: miles for stop, miles in enumerate(_worker["deadlines"]) if miles != no_deadline}
+    rows = _worker["rows"]
+    scores = array("d", [
+        route_cost(routes[i:i + length], rows, deadline_miles, min_return, cutoff)
+        for i in range(0, len(routes), length)
+    ])
+    return scores.tobytes()
+
+
+# pytest
+def test_fitness_pool():
+    import random
+
+    from Genetic import GeneticRoute
+
+    rng = random.Random(3)
+    size = 30
+    adjacency_mat = [[abs(i - j) + rng.random() * (i != j) for j in range(size)] for i in range(size)]
+    for i in range(size):
+        for j in range(i):
+            adjacency_mat[i][j] = adjacency_mat[j][i]
+    stops = list(range(1, size))
+    route = GeneticRoute([rng.sample(stops, len(stops)) for _ in range(50)], adjacency_mat, {}, None, None)
+    route.deadline_miles = {3: 5.0, 7: 20.0}
+    expected = [route.fitness(chromosome) for chromosome in route.bag]
+
+    with FitnessPool(adjacency_mat, workers=2) as pool:
+        route.pool = pool
+        route.evaluate()
+        assert route.scores == expected
+        route.deadline_miles = {}
+        route.evaluate()
+        assert route.scores == [route_cost(chromosome, adjacency_mat, {}, 0) for chromosome in route.bag]
+
+        # Two threads with other deadlines share the pool and still get their own scores
+        bag = [array("H", chromosome) for chromosome in route.bag]
+        deadlines = [{3: 5.0, 7: 20.0}, {5: 2.0}]
+        results = [[], []]
+
+        def work(thread):
+            for _ in range(20):
+                results[thread].append(pool.evaluate(bag, deadlines[thread], 0))
+
+        threads = [threading.Thread(target=work, args=(thread,)) for thread in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for thread in range(2):
+            expected = [route_cost(chromosome, adjacency_mat, deadlines[thread], 0) for chromosome in bag]
+            assert all(scores == expected for scores in results[thread])
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    from Genetic import GeneticRoute
+
+    # One generation of a large population, serial and with the pool
+    size = 300
+    points = [(random.random() * 10, random.random() * 10) for _ in range(size)]
+    adjacency_mat = [[abs(a[0] - b[0]) + abs(a[1] - b[1]) for b in points] for a in points]
+    stops = list(range(1, size))
+    route = GeneticRoute([random.sample(stops, len(stops)) for _ in range(5000)], adjacency_mat, {}, None, None)
+    start = time.perf_counter()
+    route.evaluate()
+    print(f"serial: {time.perf_counter() - start:.2f} s")
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        with FitnessPool(adjacency_mat, workers) as pool:
+            route.pool = pool
+            route.evaluate()
+            start = time.perf_counter()
+            route.evaluate()
+            print(f"{workers} workers: {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,280 @@
+import os
+import random
+import tempfile
+
+from DistanceMatrix import expand_route, load_distance_matrix
+from Helper import (
+    convert_package_id_to_address_index,
+    convert_to_hours,
+    create_address_dict,
+    delivery_times,
+    fill_hash_table,
+    fill_package_truck_id,
+    genetic_algorithm,
+    truck_finish_time,
+)
+from Truck import Truck
+
+"""Importable API to plan a day of deliveries. Importing this module only defines functions, it does not read the CSV
+files, seed random or ask for input, so it can be used by worker processes and short jobs. main.py is the command
+line program on top of plan_day."""
+
+CSV_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "CSVFiles")
+HUB_ADDRESS = "4001 S700 E"
+
+# Most times the routes are solved again with more iterations when they are longer than max_distance
+MAX_RETRIES = 5
+
+# Seconds that "import Planner" should take in a new interpreter, on top of starting python itself, see the benchmark
+COLD_START_BUDGET = 0.25
+
+# Checks that importing Planner in a new interpreter does not touch random or load the heavy modules
+COLD_START_CODE = (
+    "import random, sys\n"
+    "state = random.getstate()\n"
+    "import Planner\n"
+    "assert random.getstate() == state\n"
+    "assert 'openpyxl' not in sys.modules and 'numpy' not in sys.modules and 'Fleet' not in sys.modules\n"
+)
+
+
+class DayPlan:
+    """The result of plan_day: the packages with their delivery times, the loaded trucks and their routes"""
+
+    def __init__(
+            self, hash_map, distance_matrix: list, address_index: dict, trucks: list, next_hop: list = None
+    ) -> None:
+        self.hash_map = hash_map
+        # Shortest distances between the addresses, see DistanceMatrix.load_distance_matrix
+        self.distance_matrix = distance_matrix
+        # next_hop[i][j] is the address after i on the way from i to j, see DistanceMatrix.expand_route
+        self.next_hop = next_hop
+        self.address_index = address_index
+        self.trucks = trucks
+        # Route of each truck as address indexes, starting and ending at the hub
+        self.routes: list = []
+        # Stops of each truck from delivery_times as [address, [package ids], total distance, delivery time]
+        self.deliveries: list = []
+
+    @property
+    def total_distance(self) -> float:
+        return sum(truck.total_distance for truck in self.trucks)
+
+    def paths(self) -> list:
+        """The route of each truck with the addresses it drives through between the stops, for the drivers"""
+        return [expand_route(route, self.next_hop) for route in self.routes]
+
+
+def load_truck_easy(truck1: Truck, truck2: Truck, truck3: Truck) -> None:
+    """Manual loading of the truck packages
+    Big(O): O(1)
+    """
+    truck1.packages = [7, 29, 19, 1, 13, 39, 20, 21, 4, 40, 14, 15, 16, 34, 30, 31]
+    truck2.packages = [18, 36, 3, 8, 6, 32, 5, 37, 38, 25, 26]
+    truck3.packages = [27, 35, 2, 33, 11, 28, 17, 12, 24, 23, 10, 22, 9]
+
+
+def plan_day(
+        packages_csv: str = os.path.join(CSV_FOLDER, "packages.csv"),
+        distance_csv: str = os.path.join(CSV_FOLDER, "distance_table.csv"),
+        addresses_csv: str = os.path.join(CSV_FOLDER, "addresses.csv"),
+        num_iter: int = 1000,
+        max_distance: float = 140,
+        seed=None,
+        fleet: bool = False,
+        verbose: bool = False,
+        exact_threshold: int = 16,
+        checkpoint_dir: str = None,
+        departure_times: list = None,
+        loads: list = None,
+        distance_data: tuple = None,
+) -> DayPlan:
+    """
+    Load the package and distance files, load the three trucks, find their routes and set the delivery time of
+    every package.
+    :param packages_csv: path of the packages csv
+    :param distance_csv: path of the distance table csv
+    :param addresses_csv: path of the addresses csv
+    :param num_iter: number of iterations for the genetic algorithm of each truck
+    :param max_distance: the routes of all trucks are solved again with more iterations until they are shorter, at
+    most MAX_RETRIES times. Not used when every truck is solved exactly, the exact routes are already the shortest
+    :param seed: seed for the random.Random of the solvers, None for a different plan every time. The random module is
+    not used, so plans can be made in threads of one process and the same seed always gives the same plan
+    :param fleet: use the fleet solver to also choose the packages of each truck, instead of the manual loading
+    :param verbose: print the progress
+    :param exact_threshold: trucks with up to this many stops are solved exactly, see genetic_algorithm
+    :param checkpoint_dir: folder for the checkpoints of the genetic algorithm of each truck. When the routes are too
+    long, the next try continues from the checkpoints instead of starting over. A temporary folder is used if None
+    :param departure_times: departure time of each truck as "hh:mm:ss", 08:00, 09:05 and 10:20 if None. Truck 3 still
+    waits for truck 1 to come back, there are only two drivers
+    :param loads: list of the package ids of each truck, instead of load_truck_easy. Not used with fleet
+    :param distance_data: (distance matrix, next_hop) from load_distance_matrix, so a process that makes many plans
+    only loads the distances once. Read from distance_csv if None
+    :return: DayPlan with the packages, trucks and routes
+    """
+    rng = random.Random(seed)
+
+    if verbose:
+        print("Setting up data structures...")
+    hash_map = fill_hash_table(packages_csv)
+    # The shortest distances between the addresses, from a cache next to distance_csv when it has not changed
+    if distance_data is None:
+        distance_data = load_distance_matrix(distance_csv)
+    distance_matrix, next_hop = distance_data
+    address_index = create_address_dict(addresses_csv)
+
+    speed = 18
+    truck1 = Truck(1, speed=speed, location=HUB_ADDRESS,
+                   departure_time="08:00:00")  # early departure, more time sensitive packages
+    truck2 = Truck(2, speed=speed, location=HUB_ADDRESS, departure_time="09:05:00")  # late arrival packages
+    truck3 = Truck(3, speed=speed, location=HUB_ADDRESS, departure_time="10:20:00")  # EOD deliveries and left overs
+    plan = DayPlan(hash_map, distance_matrix, address_index, [truck1, truck2, truck3], next_hop)
+    if departure_times is not None:
+        for truck, departure_time in zip(plan.trucks, departure_times):
+            truck.departure_time = departure_time
+
+    if fleet:
+        _plan_fleet(plan, num_iter, verbose, rng)
+    else:
+        if loads is None:
+            load_truck_easy(truck1, truck2, truck3)
+        else:
+            for truck, load in zip(plan.trucks, loads):
+                truck.packages = list(load)
+        if checkpoint_dir is None:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                _plan_trucks(plan, num_iter, max_distance, verbose, exact_threshold, temp_dir, rng)
+        else:
+            _plan_trucks(plan, num_iter, max_distance, verbose, exact_threshold, checkpoint_dir, rng)
+
+    for truck in plan.trucks:
+        fill_package_truck_id(hash_map, truck)
+
+    if verbose:
+        print(f"Total trip distance is {plan.total_distance:.2f} miles.")
+        print("Updating package data...")
+    # Setting the delivery times of each package, delivery_times adds the hub to both ends of the route
+    for truck in plan.trucks:
+        route = list(truck.route)
+        plan.deliveries.append(delivery_times(truck, route, distance_matrix, address_index, hash_map))
+        plan.routes.append(route)
+    return plan
+
+
+def _plan_trucks(
+        plan: DayPlan,
+        num_iter: int,
+        max_distance: float,
+        verbose: bool,
+        exact_threshold: int,
+        checkpoint_dir: str,
+        rng: random.Random,
+) -> None:
+    """Find the route of each manually loaded truck, if the route is not good enough increase the number of iterations
+    and continue each truck from its checkpoint. Raises ValueError when the routes are still too long after
+    MAX_RETRIES tries. When every truck is solved exactly, more iterations would not change anything, so the routes
+    are kept as they are
+    """
+    truck1, truck2, truck3 = plan.trucks
+    failures = 0
+    while True:
+        exact = True
+        for truck in plan.trucks:
+            if verbose:
+                print(f"Determining truck {truck.id} route...")
+            if truck is truck3:
+                # Since truck 3 does not leave until 10:20 AM, the package address can be updated right before
+                # the path is computed or until the first truck returns back to the hub, so whichever is later will
+                # be the departure time of truck3.
+                if convert_to_hours(truck1.finish_time) > convert_to_hours(truck3.departure_time):
+                    truck3.departure_time = truck1.finish_time
+
+                # Update package address for package ID number 9
+                plan.hash_map.get_item(9).address = "410 S State St"
+
+            package_indexes = convert_package_id_to_address_index(truck.packages, plan.address_index, plan.hash_map)
+            exact = exact and len(package_indexes) <= exact_threshold
+            truck.route, truck.total_distance = genetic_algorithm(
+                package_indexes, plan.distance_matrix, plan.address_index, plan.hash_map, truck,
+                num_iter=num_iter, verbose=verbose, exact_threshold=exact_threshold,
+                checkpoint_path=os.path.join(checkpoint_dir, f"truck{truck.id}.checkpoint"), rng=rng,
+            )
+            # Update the finish time of the route
+            truck.finish_time = truck_finish_time(truck, truck.total_distance)
+
+        if plan.total_distance < max_distance or exact:
+            return
+        failures += 1
+        if failures > MAX_RETRIES:
+            raise ValueError(f"The routes are still {plan.total_distance:.2f} miles after {MAX_RETRIES} retries, "
+                             f"more than max_distance {max_distance}")
+        if verbose:
+            print("Route is too long, increasing iterations and running again")
+        # If it keeps failing then the number of failures will scale the iterations by an exponent
+        num_iter += 10 * pow(failures, failures)
+
+
+def _plan_fleet(plan: DayPlan, num_iter: int, verbose: bool, rng: random.Random) -> None:
+    """Load the trucks and find their routes with the fleet solver"""
+    # The fleet solver is only imported when it is used
+    from Fleet import FleetRoute, assign_fleet, fleet_genetic_algorithm
+
+    truck1, truck2, truck3 = plan.trucks
+    # Package 9 can only leave on a truck after the address is corrected, see Fleet.package_constraints
+    plan.hash_map.get_item(9).address = "410 S State St"
+    # Two drivers, so truck 3 cannot leave before truck 1 is back. The split puts truck 3 right after truck 1 and
+    # checks the deadlines with the later departure
+    trucks = [truck1, truck3, truck2]
+    waits = {truck3.id}
+    tour, _ = fleet_genetic_algorithm(
+        plan.hash_map.keys(), plan.distance_matrix, plan.address_index, plan.hash_map, trucks,
+        num_iter=num_iter, verbose=verbose, rng=rng, waits=waits
+    )
+    route = FleetRoute([], plan.distance_matrix, plan.address_index, plan.hash_map, trucks, waits=waits)
+    assign_fleet(route, tour)
+
+
+# pytest
+def test_cold_start():
+    import subprocess
+    import sys
+
+    subprocess.run([sys.executable, "-c", COLD_START_CODE], check=True, cwd=os.path.dirname(CSV_FOLDER))
+
+
+def test_plan_day():
+    plan = plan_day(seed=42)
+    assert plan.total_distance < 140
+    # The exact routes are the shortest there are, a smaller max_distance does not make plan_day try again
+    assert plan_day(seed=42, max_distance=50).total_distance == plan.total_distance
+    # The real paths are as long as the routes, and have every stop of the route in the same order
+    for route, path in zip(plan.routes, plan.paths()):
+        remaining = iter(path)
+        assert all(stop in remaining for stop in route)
+        miles = sum(plan.distance_matrix[a][b] for a, b in zip(path, path[1:]))
+        assert abs(miles - sum(plan.distance_matrix[a][b] for a, b in zip(route, route[1:]))) < 1e-6
+    assert sorted(p for truck in plan.trucks for p in truck.packages) == list(range(1, 41))
+    for truck in plan.trucks:
+        for package_id in truck.packages:
+            package = plan.hash_map.get_item(package_id)
+            assert package.truck_id == truck.id
+            if package.deadline != "EOD":
+                assert convert_to_hours(package.delivery_time) <= convert_to_hours(package.deadline)
+
+
+def _run_seconds(code: str) -> float:
+    """Seconds to run code in a new interpreter"""
+    import subprocess
+    import sys
+    import time
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(CSV_FOLDER))
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    # Cold start of "import Planner" on top of starting python itself
+    baseline = min(_run_seconds("pass") for _ in range(3))
+    cold_start = min(_run_seconds(COLD_START_CODE) for _ in range(3)) - baseline
+    print(f"import Planner: {cold_start:.3f} s, budget {COLD_START_BUDGET} s")
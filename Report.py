@@ -0,0 +1,256 @@
+import csv
+import json
+import sys
+from itertools import islice
+
+from HashTable import HashTable
+from Helper import convert_to_hours
+
+"""Status reports of the packages and trucks at a time of the day. The rows are made one at a time and written in
+blocks to any text stream, a file or the console, as text, CSV or JSON, with optional filters and pages."""
+
+# Columns of a package status row, in the order of the CSV file
+PACKAGE_COLUMNS = ["id", "truck_id", "address", "city", "zipcode", "deadline", "status", "delivery_time"]
+
+# Range indexes that packages_with_status needs
+STATUS_RANGE_INDEXES = ["departure_time", "delivery_time"]
+
+# Number of text lines joined into one write
+BLOCK_SIZE = 1000
+
+
+def package_status_rows(some_time: str, hash_table: HashTable, filters: dict = None):
+    """Make the status row of each package at some_time, in the order of the package ids. The packages are not
+    changed, the status is worked out from the departure and delivery times.
+    :param some_time: string format that the user will enter as "hh:mm:ss"
+    :param hash_table: hash table of the packages with package id as the keys
+    :param filters: only the packages where every attribute in the dict has the given value, for example
+    {"truck_id": 2, "status": "Delivered"}. The attributes other than status are looked up with HashTable.find, and
+    the status with packages_with_status when the table has its range indexes
+    :return: generator of dictionaries with the PACKAGE_COLUMNS as keys
+    Big(O): O(k log k) for k packages that pass the filters, O(n) for the packages "At Hub" or without the range
+    indexes
+    """
+    some_time_float = convert_to_hours(some_time)
+    filters = dict(filters or {})
+    status_filter = filters.pop("status", None)
+
+    package_ids = None
+    for field, value in filters.items():
+        ids = {package.id for package in hash_table.find(field, value)}
+        package_ids = ids if package_ids is None else package_ids & ids
+    if status_filter is not None and all(field in hash_table.range_indexes for field in STATUS_RANGE_INDEXES):
+        ids = {package.id for package in packages_with_status(hash_table, status_filter, some_time)}
+        package_ids = ids if package_ids is None else package_ids & ids
+    package_id_list = sorted(hash_table.keys() if package_ids is None else package_ids)
+
+    # Since we will already know what time the package will be delivered,
+    # check to see if the delivery time of the package is less than or
+    # equal to some_time
+    for package_id in package_id_list:
+        package = hash_table.get_item(package_id)
+        if convert_to_hours(package.delivery_time) <= some_time_float:
+            status = "Delivered"
+            delivery_time = package.delivery_time
+        elif convert_to_hours(package.departure_time) <= some_time_float:
+            status = "In Route"
+            delivery_time = f"ETA: {package.delivery_time}"
+        else:
+            status = "At Hub"
+            delivery_time = f"ETA: {package.delivery_time}"
+        if status_filter is not None and status != status_filter:
+            continue
+        yield {
+            "id": package.id,
+            "truck_id": package.truck_id,
+            "address": package.address,
+            "city": package.city,
+            "zipcode": package.zipcode,
+            "deadline": package.deadline,
+            "status": status,
+            "delivery_time": delivery_time,
+        }
+
+
+def packages_with_status(hash_table: HashTable, status: str, some_time: str) -> list:
+    """Find the packages with a status at some_time with range queries, the same status as package_status_rows gives.
+    The hash table needs range indexes on departure_time and delivery_time, as made by fill_hash_table.
+    :param hash_table: hash table of the packages with package id as the keys
+    :param status: "Delivered", "In Route" or "At Hub"
+    :param some_time: string format that the user will enter as "hh:mm:ss"
+    :return: list of the packages, in the order of the package ids
+    Big(O): O(log n + k log k) for k packages delivered or on the way, O(n log n) for the packages at the hub
+    """
+    delivered = {package.id for package in hash_table.find_range("delivery_time", high=some_time)}
+    if status == "Delivered":
+        package_ids = delivered
+    else:
+        departed = {package.id for package in hash_table.find_range("departure_time", high=some_time)}
+        if status == "In Route":
+            package_ids = departed - delivered
+        else:
+            package_ids = set(hash_table.keys()) - departed - delivered
+    return [hash_table.get_item(package_id) for package_id in sorted(package_ids)]
+
+
+def truck_distance_rows(some_time: str, trucks: list):
+    """Make a row with the miles each truck has driven by some_time, for any number of trucks
+    :param some_time: string format that the user will enter as "hh:mm:ss"
+    :param trucks: list of truck objects with departure and finish times
+    :return: generator of dictionaries with the truck id and the miles
+    Big(O): O(n) for n trucks
+    """
+    current_time = convert_to_hours(some_time)
+    for truck in trucks:
+        depart_time = convert_to_hours(truck.departure_time)
+        finish_time = convert_to_hours(truck.finish_time)
+        if finish_time < current_time:
+            total_time = finish_time - depart_time
+        else:
+            total_time = current_time - depart_time
+        yield {"truck_id": truck.id, "miles": max(total_time, 0) * truck.speed}
+
+
+def paginate(rows, page: int = None, page_size: int = None):
+    """Keep only one page of the rows, pages start at 1
+    Big(O): O(page * page_size), the rows after the page are never made"""
+    if page is None or page_size is None:
+        return rows
+    start = (page - 1) * page_size
+    return islice(rows, start, start + page_size)
+
+
+def write_rows(rows, out=None, fmt: str = "text", line_format: str = None, columns: list = None) -> int:
+    """Write the rows to a text stream in blocks instead of one print for each row.
+    :param rows: iterable of dictionaries
+    :param out: text stream like an open file, sys.stdout by default
+    :param fmt: "text" for one line for each row made with line_format, "csv" with a header, or "json" for a list
+    :param line_format: format string with the keys of a row, used by "text"
+    :param columns: keys of the rows in the order of the CSV columns
+    :return: number of rows written
+    Big(O): O(n) for n rows
+    """
+    if out is None:
+        out = sys.stdout
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=columns, lineterminator="\n")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif fmt == "json":
+        out.write("[")
+        for row in rows:
+            out.write((",\n" if count else "\n") + json.dumps(row))
+            count += 1
+        out.write("\n]\n")
+    elif fmt == "text":
+        block = []
+        for row in rows:
+            block.append(line_format.format(**row))
+            count += 1
+            if len(block) == BLOCK_SIZE:
+                out.write("\n".join(block) + "\n")
+                block = []
+        if block:
+            out.write("\n".join(block) + "\n")
+    else:
+        raise ValueError(f"Unknown report format {fmt}")
+    return count
+
+
+def write_package_report(
+        some_time: str,
+        hash_table: HashTable,
+        out=None,
+        fmt: str = "text",
+        filters: dict = None,
+        page: int = None,
+        page_size: int = None,
+) -> int:
+    """Write the status of the packages at some_time, see package_status_rows and write_rows
+    :return: number of packages written
+    Big(O): O(n)"""
+    if out is None:
+        out = sys.stdout
+    rows = paginate(package_status_rows(some_time, hash_table, filters), page, page_size)
+    if fmt == "text":
+        out.write(f"Package status table at {some_time}:\n")
+    return write_rows(
+        rows,
+        out,
+        fmt,
+        "Package ID: {id} | Truck ID: {truck_id} | Address: {address}, {city}, {zipcode} | Deadline: {deadline} | "
+        "Status: {status} | Time of Delivery: {delivery_time}",
+        PACKAGE_COLUMNS,
+    )
+
+
+def write_truck_report(some_time: str, trucks: list, out=None, fmt: str = "text") -> int:
+    """Write the miles driven by every truck at some_time and the total
+    :return: number of trucks written
+    Big(O): O(n) for n trucks"""
+    if out is None:
+        out = sys.stdout
+    rows = list(truck_distance_rows(some_time, trucks))
+    if fmt != "text":
+        return write_rows(rows, out, fmt, columns=["truck_id", "miles"])
+    out.write(f"Distance (miles) traveled by all trucks at {some_time}:\n")
+    write_rows(rows, out, fmt, "\tTruck{truck_id}: {miles:.2f} miles")
+    out.write(f"\tTotal: {sum(row['miles'] for row in rows):.2f} miles\n\n")
+    return len(rows)
+
+
+# pytest
+def test_reports():
+    import io
+
+    from Package import Package
+    from Truck import Truck
+
+    hash_table = HashTable()
+    hash_table.create_index("truck_id")
+    for package_id in range(1, 6):
+        package = Package(package_id, "1060 Dalton Ave S", "Salt Lake City", "UT", "84104", "EOD", "5", "None")
+        package.truck_id = 1 if package_id < 4 else 2
+        package.departure_time = "08:00:00"
+        package.delivery_time = f"0{package_id + 7}:00:00"
+        hash_table.insert(package_id, package)
+
+    out = io.StringIO()
+    assert write_package_report("09:30:00", hash_table, out) == 5
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "Package status table at 09:30:00:"
+    assert "Status: Delivered" in lines[2] and "Status: In Route" in lines[3]
+
+    out = io.StringIO()
+    assert write_package_report("09:30:00", hash_table, out, "csv", {"truck_id": 1, "status": "Delivered"}) == 2
+    assert list(csv.DictReader(io.StringIO(out.getvalue())))[1]["id"] == "2"
+
+    out = io.StringIO()
+    assert write_package_report("09:30:00", hash_table, out, "json", page=2, page_size=2) == 2
+    assert [row["id"] for row in json.loads(out.getvalue())] == [3, 4]
+
+    # The same statuses come from the range indexes
+    from Helper import time_key
+
+    hash_table.create_range_index("departure_time", time_key)
+    hash_table.create_range_index("delivery_time", time_key)
+    hash_table.get_item(5).departure_time = "10:00:00"
+    for status, ids in (("Delivered", [1, 2]), ("In Route", [3, 4]), ("At Hub", [5])):
+        assert [package.id for package in packages_with_status(hash_table, status, "09:30:00")] == ids
+        assert [row["id"] for row in package_status_rows("09:30:00", hash_table, {"status": status})] == ids
+
+    # A report does not change the packages, the address of package 9 is only updated by the WGUPS display
+    hash_table.insert(9, Package(9, "300 State St", "Salt Lake City", "UT", "84103", "EOD", "2", "None"))
+    hash_table.get_item(9).departure_time = hash_table.get_item(9).delivery_time = "08:00:00"
+    write_package_report("11:00:00", hash_table, io.StringIO())
+    assert hash_table.get_item(9).address == "300 State St"
+
+    trucks = [Truck(i, 18, "4001 S700 E", "08:00:00") for i in range(1, 5)]
+    for truck in trucks:
+        truck.finish_time = "09:00:00"
+    out = io.StringIO()
+    assert write_truck_report("08:30:00", trucks, out) == 4
+    assert "\tTruck4: 9.00 miles" in out.getvalue() and "\tTotal: 36.00 miles" in out.getvalue()
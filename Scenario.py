@@ -0,0 +1,307 @@
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from DistanceMatrix import load_distance_matrix
+from Fleet import package_constraints
+from Helper import convert_to_hours, hours_to_string
+from Planner import CSV_FOLDER, load_truck_easy, plan_day
+from Report import write_rows
+from Truck import Truck
+
+"""What-if plans for other departure times, truck loads and solver budgets. Every scenario is planned with plan_day in
+a pool of worker processes that load the distances once, and the plans that no other plan beats on total miles, latest
+delivery and deadline slack together are returned as the Pareto front."""
+
+# Columns of a scenario result, in order
+SCENARIO_COLUMNS = [
+    "label", "departure_times", "exact_threshold", "num_iter", "seed", "total_miles", "latest_delivery", "min_slack", "late",
+    "broken_rules",
+]
+
+# Data of the worker processes, set once by _init_worker
+_worker = {}
+
+
+class Scenario:
+    """One choice of departure times, loads and solver budget for plan_day"""
+
+    def __init__(
+            self,
+            departure_times: list,
+            loads: list = None,
+            num_iter: int = 1000,
+            seed: int = 0,
+            label: str = "",
+            exact_threshold: int = 16,
+    ) -> None:
+        """
+        :param departure_times: departure time of each truck as "hh:mm:ss"
+        :param loads: list of the package ids of each truck, the manual loading of load_truck_easy if None
+        :param num_iter: number of iterations for the genetic algorithm of each truck
+        :param seed: seed of the plan
+        :param label: name of the scenario in the results
+        :param exact_threshold: trucks with up to this many stops are solved exactly, see plan_day. num_iter and seed
+        only change the plan of the trucks with more stops, so use 0 to compare solver budgets
+        """
+        self.departure_times = list(departure_times)
+        self.loads = None if loads is None else [list(load) for load in loads]
+        self.num_iter = num_iter
+        self.seed = seed
+        self.label = label
+        self.exact_threshold = exact_threshold
+
+
+def grid_scenarios(
+        departure_options: list,
+        loads_options: list = (None,),
+        num_iters=(1000,),
+        seeds=(0,),
+        exact_threshold: int = 16,
+) -> list:
+    """Every combination of the options
+    :param departure_options: for each truck, the list of departure times to try
+    :param loads_options: list of loads to try, None for the manual loading
+    :param num_iters: solver budgets to try
+    :param seeds: seeds to try
+    :param exact_threshold: for every scenario, see Scenario. The budgets and seeds only matter below 16
+    :return: list of Scenario
+    Big(O): O(product of the number of options)"""
+    scenarios = []
+    for number, (departures, loads, num_iter, seed) in enumerate(
+            itertools.product(itertools.product(*departure_options), loads_options, num_iters, seeds)):
+        scenarios.append(Scenario(departures, loads, num_iter, seed, f"grid-{number}", exact_threshold))
+    return scenarios
+
+
+def random_scenarios(
+        count: int,
+        rng: random.Random,
+        departure_windows: list,
+        base_loads: list = None,
+        moves: int = 2,
+        movable: list = (),
+        num_iters=(1000,),
+        exact_threshold: int = 16,
+) -> list:
+    """
+    Random scenarios: each truck leaves at a random minute in its window, and a few packages are moved from the base
+    loads to another truck that has room.
+    :param count: number of scenarios
+    :param rng: random.Random for the samples and the seeds of the plans
+    :param departure_windows: (earliest, latest) departure time of each truck as "hh:mm:ss"
+    :param base_loads: loads to start from, the manual loading if None
+    :param moves: number of packages moved in each scenario
+    :param movable: ids of the packages that may be moved, see movable_packages
+    :param num_iters: solver budgets to pick from
+    :param exact_threshold: for every scenario, see Scenario. The budgets and seeds only matter below 16
+    :return: list of Scenario
+    Big(O): O(count * (trucks + moves))
+    """
+    if base_loads is None:
+        trucks = [Truck(number, 18, "") for number in range(1, 4)]
+        load_truck_easy(*trucks)
+        base_loads = [truck.packages for truck in trucks]
+    scenarios = []
+    for number in range(count):
+        departures = []
+        for earliest, latest in departure_windows:
+            minute = rng.randint(round(convert_to_hours(earliest) * 60), round(convert_to_hours(latest) * 60))
+            departures.append(hours_to_string(minute / 60))
+        loads = [list(load) for load in base_loads]
+        for package_id in rng.sample(list(movable), min(moves, len(movable))):
+            source = next(load for load in loads if package_id in load)
+            targets = [load for load in loads if load is not source and len(load) < 16]
+            if targets:
+                source.remove(package_id)
+                rng.choice(targets).append(package_id)
+        scenarios.append(Scenario(
+            departures, loads, rng.choice(num_iters), rng.randrange(2 ** 32), f"random-{number}", exact_threshold
+        ))
+    return scenarios
+
+
+def movable_packages(hash_map) -> list:
+    """Ids of the packages without a special note or a deadline, which can go on any truck at any time
+    Big(O): O(n)"""
+    return [package.id for package in hash_map.find("note", "None") if package.deadline == "EOD"]
+
+
+def _init_worker(packages_csv: str, distance_csv: str, addresses_csv: str) -> None:
+    """Load the distances once for every scenario the worker plans"""
+    _worker.update(
+        packages_csv=packages_csv,
+        distance_csv=distance_csv,
+        addresses_csv=addresses_csv,
+        distance_data=load_distance_matrix(distance_csv),
+    )
+
+
+def _run(scenario: Scenario) -> dict:
+    """Plan one scenario and measure it
+    :return: dictionary with the SCENARIO_COLUMNS as keys"""
+    plan = plan_day(
+        _worker["packages_csv"], _worker["distance_csv"], _worker["addresses_csv"],
+        num_iter=scenario.num_iter, max_distance=float("inf"), seed=scenario.seed,
+        exact_threshold=scenario.exact_threshold,
+        departure_times=scenario.departure_times, loads=scenario.loads, distance_data=_worker["distance_data"],
+    )
+    latest = 0
+    slack = float("inf")
+    late = 0
+    for package_id in plan.hash_map.keys():
+        package = plan.hash_map.get_item(package_id)
+        delivered = convert_to_hours(package.delivery_time)
+        latest = max(latest, delivered)
+        if package.deadline != "EOD":
+            slack = min(slack, convert_to_hours(package.deadline) - delivered)
+            late += delivered > convert_to_hours(package.deadline)
+    return {
+        "label": scenario.label,
+        "departure_times": " ".join(truck.departure_time for truck in plan.trucks),
+        "exact_threshold": scenario.exact_threshold,
+        "num_iter": scenario.num_iter,
+        "seed": scenario.seed,
+        "total_miles": round(plan.total_distance, 2),
+        "latest_delivery": hours_to_string(latest),
+        # Minutes between the deadline and the delivery of the tightest package, below zero when one is late
+        "min_slack": round(slack * 60, 2),
+        "late": late,
+        "broken_rules": broken_rules(plan),
+    }
+
+
+def broken_rules(plan) -> int:
+    """Count the special notes a plan does not follow: a package on the wrong truck or on a truck that leaves before
+    the package is at the hub, and a group of packages that is split over trucks
+    Big(O): O(n)"""
+    constraints = package_constraints(plan.hash_map)
+    truck_of = {}
+    departure_of = {}
+    for truck in plan.trucks:
+        for package_id in truck.packages:
+            truck_of[package_id] = truck.id
+            departure_of[package_id] = convert_to_hours(truck.departure_time)
+    broken = 0
+    groups = {}
+    for package_id, rules in constraints.items():
+        if rules["truck"] is not None and truck_of[package_id] != rules["truck"]:
+            broken += 1
+        if departure_of[package_id] < rules["ready"] - 1e-9:
+            broken += 1
+        if rules["group"] is not None:
+            groups.setdefault(rules["group"], set()).add(truck_of[package_id])
+    return broken + sum(len(trucks) - 1 for trucks in groups.values())
+
+
+def run_scenarios(
+        scenarios: list,
+        workers: int = None,
+        packages_csv: str = os.path.join(CSV_FOLDER, "packages.csv"),
+        distance_csv: str = os.path.join(CSV_FOLDER, "distance_table.csv"),
+        addresses_csv: str = os.path.join(CSV_FOLDER, "addresses.csv"),
+) -> list:
+    """
+    Plan every scenario in a pool of worker processes.
+    :param scenarios: list of Scenario
+    :param workers: number of worker processes, None for one for each CPU and 1 to plan in this process
+    :param packages_csv: path of the packages csv
+    :param distance_csv: path of the distance table csv
+    :param addresses_csv: path of the addresses csv
+    :return: list of results with the SCENARIO_COLUMNS as keys, in the order of scenarios
+    Big(O): O(s) plans for s scenarios, spread over the workers
+    """
+    initargs = (packages_csv, distance_csv, addresses_csv)
+    if workers == 1:
+        _init_worker(*initargs)
+        return [_run(scenario) for scenario in scenarios]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        return list(pool.map(_run, scenarios))
+
+
+def pareto_front(results: list, valid_only: bool = True) -> list:
+    """
+    The results that no other result beats: another result beats it when it is at least as good on total miles,
+    latest delivery and minimum slack, and better on at least one of them.
+    :param results: from run_scenarios
+    :param valid_only: leave out the plans that break a special note
+    :return: the results on the front, sorted by total miles
+    Big(O): O(n^2) for n results
+    """
+    def objectives(result):
+        # Smaller is better for all three
+        return result["total_miles"], convert_to_hours(result["latest_delivery"]), -result["min_slack"]
+
+    candidates = [result for result in results if not valid_only or result["broken_rules"] == 0]
+    points = [objectives(result) for result in candidates]
+    front = []
+    for result, point in zip(candidates, points):
+        if not any(other != point and all(a <= b for a, b in zip(other, point)) for other in points):
+            front.append(result)
+    return sorted(front, key=objectives)
+
+
+def write_results(results: list, out=None, fmt: str = "text") -> int:
+    """Write the results as text, CSV or JSON, see Report.write_rows
+    :return: number of rows written"""
+    return write_rows(
+        results,
+        out,
+        fmt,
+        "{label:<10} {departure_times}  {total_miles:7.2f} miles  last delivery {latest_delivery}  "
+        "slack {min_slack:7.2f} min  {late} late  {broken_rules} broken rules",
+        SCENARIO_COLUMNS,
+    )
+
+
+# pytest
+def test_pareto_front():
+    def result(label, miles, latest, slack, broken=0):
+        return {"label": label, "total_miles": miles, "latest_delivery": latest, "min_slack": slack,
+                "broken_rules": broken}
+
+    results = [
+        result("short", 90, "13:00:00", 5),
+        result("early", 100, "12:00:00", 5),
+        result("beaten", 100, "13:00:00", 5),
+        result("safe", 110, "13:00:00", 30),
+        result("broken", 80, "11:00:00", 60, broken=1),
+    ]
+    assert [r["label"] for r in pareto_front(results)] == ["short", "early", "safe"]
+    assert [r["label"] for r in pareto_front(results, valid_only=False)] == ["broken"]
+
+
+def test_run_scenarios():
+    scenarios = grid_scenarios([["08:00:00"], ["09:05:00", "09:30:00"], ["10:20:00"]])
+    results = run_scenarios(scenarios, workers=1)
+    assert [r["departure_times"].split()[1] for r in results] == ["09:05:00", "09:30:00"]
+    for r in results:
+        assert r["broken_rules"] == 0 and r["late"] == 0 and r["min_slack"] >= 0
+    assert pareto_front(results)
+
+    # Without the exact solver the budget changes the plan, and a tiny budget gives longer routes
+    budgets = run_scenarios(grid_scenarios([["08:00:00"], ["09:05:00"], ["10:20:00"]], num_iters=[1, 500],
+                                           exact_threshold=0), workers=1)
+    assert budgets[0]["total_miles"] > budgets[1]["total_miles"] >= results[0]["total_miles"]
+
+    # Moving a package to another truck keeps every package on exactly one truck
+    from Helper import fill_hash_table
+
+    movable = movable_packages(fill_hash_table(os.path.join(CSV_FOLDER, "packages.csv")))
+    scenario, = random_scenarios(1, random.Random(0), [("08:00:00", "08:30:00")] * 3, moves=3, movable=movable)
+    assert sorted(p for load in scenario.loads for p in load) == list(range(1, 41))
+    assert all(convert_to_hours("08:00:00") <= convert_to_hours(t) <= convert_to_hours("08:30:00")
+               for t in scenario.departure_times)
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    grid = grid_scenarios(
+        [["08:00:00"], ["09:05:00", "09:20:00", "09:40:00"], ["10:20:00", "10:40:00", "11:00:00"]]
+    )
+    results = run_scenarios(grid)
+    print(f"{len(results)} scenarios in {time.perf_counter() - start:.1f} s, Pareto front:")
+    write_results(pareto_front(results))